@@ -1,85 +1,235 @@
 import sys
-import a2s
+import os
 import math
 import json
-from a2s import dayzquery
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
 sys.path.append('a2s')
 
-def test_local(ip, qport):
+# served by the UI process, see Servers.QueryService
+query_socket = os.path.expanduser("~/.cache/dzgui/dzg.query.sock")
+# concurrent queries in batch mode unless --jobs is given
+BATCH_JOBS = 64
+
+usage = """usage: query_v2.py IP QPORT MODE
+       query_v2.py --batch [--jobs N] < lines of IP:QPORT:MODE"""
+
+def load_a2s():
+    """Imported only when querying directly, the service needs neither"""
+    global a2s, dayzquery
+    import a2s
+    from a2s import dayzquery
+
+def connect_service():
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
     try:
-        info = a2s.info((ip, int(qport)), 0.5)
-        name = info.server_name
-        print(name)
-    except:
-        sys.exit(1)
+        sock.connect(query_socket)
+    except OSError:
+        sock.close()
+        raise
+    return sock
 
-def get_info(ip, qport):
+def ask_service(ip, qport, mode):
+    """Reply from the query service, or None if it is not running"""
+    req = {"ip": ip, "qport": qport, "mode": mode}
     try:
-        info = a2s.info((ip, int(qport)))
-
-        name = info.server_name
-        map = info.map_name
-        address = ip + ":" + qport
-        gameport = str(info.port)
-        players = info.player_count
-        max_players = info.max_players
-        keywords = info.keywords
-        ping = (info.ping*1000)
-        ping = math.floor(ping)
-
-        res = {}
-
-        res['name'] = name
-        res['map'] = map
-        res['gametype'] = keywords
-        res['players'] = players
-        res['max_players'] = max_players
-        res['addr'] = address
-        res['gameport'] = gameport
-        res['stat'] = "online"
-        res['qport'] = qport
-        res['ping'] = str(ping) + "ms"
-
-        j = json.dumps([res])
-
-        print(j)
-    except:
-        sys.exit(1)
+        with connect_service() as sock:
+            sock.settimeout(30)
+            sock.sendall(json.dumps(req).encode() + b"\n")
+            sock.shutdown(socket.SHUT_WR)
+            reply = sock.makefile("rb").readline()
+        return json.loads(reply)
+    except (OSError, ValueError):
+        return None
+
+def test_local(ip, qport):
+    info = a2s.info((ip, int(qport)), 0.5)
+    return info.server_name
+
+def get_info(ip, qport):
+    info = a2s.info((ip, int(qport)))
+
+    name = info.server_name
+    map = info.map_name
+    address = ip + ":" + qport
+    gameport = str(info.port)
+    players = info.player_count
+    max_players = info.max_players
+    keywords = info.keywords
+    ping = (info.ping*1000)
+    ping = math.floor(ping)
+
+    res = {}
+
+    res['name'] = name
+    res['map'] = map
+    res['gametype'] = keywords
+    res['players'] = players
+    res['max_players'] = max_players
+    res['addr'] = address
+    res['gameport'] = gameport
+    res['stat'] = "online"
+    res['qport'] = qport
+    res['ping'] = str(ping) + "ms"
+
+    return json.dumps([res])
 
 def get_rules(ip, qport):
-    try:
-        mods = dayzquery.dayz_rules((ip, int(qport))).mods
-        for k in mods:
-            print(k.workshop_id)
-    except:
-        sys.exit(1)
+    mods = dayzquery.dayz_rules((ip, int(qport))).mods
+    return "\n".join(str(k.workshop_id) for k in mods)
 
 def get_names(ip, qport):
+    mods = dayzquery.dayz_rules((ip, int(qport))).mods
+    ids = []
+    names = []
+    for mod in mods:
+        names.append(mod.name)
+        ids.append(mod.workshop_id)
+    res = {}
+    res['names'] = names
+    res['ids'] = ids
+    return json.dumps(res)
+
+def query(ip, qport, mode):
+    """Output of one direct query; None if it failed"""
+    modes = {
+        "info": get_info,
+        "rules": get_rules,
+        "names": get_names,
+        "test": test_local,
+    }
+    if mode not in modes:
+        return None
     try:
-        mods = dayzquery.dayz_rules((ip, int(qport))).mods
-        ids = []
-        names = []
-        for mod in mods:
-            names.append(mod.name)
-            ids.append(mod.workshop_id)
-        res = {}
-        res['names'] = names
-        res['ids'] = ids
-        j = json.dumps(res)
-        print(j)
-    except:
-        sys.exit(1)
+        return modes[mode](ip, qport)
+    except Exception:
+        return None
+
+def parse_line(line):
+    """IP:QPORT:MODE into a request; None if malformed"""
+    fields = line.strip().split(":")
+    if len(fields) != 3 or not fields[1].isdigit():
+        return None
+    return {"ip": fields[0], "qport": fields[1], "mode": fields[2]}
+
+def emit(reply, lock):
+    with lock:
+        sys.stdout.write(json.dumps(reply) + "\n")
+        sys.stdout.flush()
+
+def batch_service(lines, jobs, sock):
+    """Streams requests through the query service, at most jobs at once"""
+    lock = threading.Lock()
+    slots = threading.Semaphore(jobs)
+    closed = threading.Event()
+
+    def _replies():
+        try:
+            for reply in sock.makefile("rb"):
+                slots.release()
+                try:
+                    emit(json.loads(reply), lock)
+                except ValueError:
+                    pass
+        except OSError:
+            pass
+        # the service went away; unblock the sender
+        closed.set()
+        slots.release(jobs)
+
+    reader = threading.Thread(target=_replies)
+    reader.start()
+    try:
+        for line in lines:
+            if not line.strip():
+                continue
+            req = parse_line(line)
+            if req is None:
+                emit({"input": line.strip(), "ok": False, "output": ""}, lock)
+                continue
+            slots.acquire()
+            if closed.is_set():
+                break
+            sock.sendall(json.dumps(req).encode() + b"\n")
+    except OSError:
+        pass
+    finally:
+        try:
+            sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        reader.join()
+        sock.close()
+
+def batch_direct(lines, jobs):
+    """Queries from a pool of jobs threads, printing as results arrive"""
+    lock = threading.Lock()
+
+    def _query(req):
+        output = query(req["ip"], req["qport"], req["mode"])
+        reply = dict(req)
+        reply["ok"] = output is not None
+        reply["output"] = output or ""
+        emit(reply, lock)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for line in lines:
+            if not line.strip():
+                continue
+            req = parse_line(line)
+            if req is None:
+                emit({"input": line.strip(), "ok": False, "output": ""}, lock)
+                continue
+            pool.submit(_query, req)
+
+def batch(args):
+    """
+    One JSON line per input line, in the order results arrive:
+    the request fields plus "ok" and "output", where output is what
+    the single query mode would print
+    """
+    jobs = BATCH_JOBS
+    if args[:1] == ["--jobs"]:
+        try:
+            jobs = max(1, int(args[1]))
+        except (IndexError, ValueError):
+            print(usage, file=sys.stderr)
+            sys.exit(2)
+    try:
+        sock = connect_service()
+    except OSError:
+        sock = None
+    if sock is not None:
+        batch_service(sys.stdin, jobs, sock)
+    else:
+        load_a2s()
+        batch_direct(sys.stdin, jobs)
+
+if sys.argv[1:2] == ["--batch"]:
+    batch(sys.argv[2:])
+    sys.exit(0)
+
+if len(sys.argv) != 4:
+    print(usage, file=sys.stderr)
+    sys.exit(2)
 
 ip = sys.argv[1]
 qport = sys.argv[2]
 mode = sys.argv[3]
 
-match mode:
-    case "info":
-        get_info(ip, qport)
-    case "rules":
-        get_rules(ip, qport)
-    case "names":
-        get_names(ip, qport)
-    case "test":
-        test_local(ip, qport)
+reply = ask_service(ip, qport, mode)
+if reply is not None:
+    if not reply["ok"]:
+        sys.exit(1)
+    if reply["output"]:
+        print(reply["output"])
+    sys.exit(0)
+
+# no service running: query directly
+load_a2s()
+output = query(ip, qport, mode)
+if output is None:
+    sys.exit(1)
+if output:
+    print(output)
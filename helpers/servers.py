@@ -1,20 +1,91 @@
+import asyncio
+import bisect
+import codecs
+import gzip
+import http.client
+import io
 import json
 import math
 import os
+import queue
 import re
 import socket
-import subprocess
+import statistics
 import sys
+import threading
+import time
 import typing  # noqa
+import zlib
 
-from dataclasses import dataclass
-from urllib import request, parse
-from urllib.error import HTTPError
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import compress
+from dataclasses import dataclass, field as dc_field
+from urllib import parse
 from typing import Union
 
 sys.path.append("a2s")
 import a2s  # noqa
 from a2s import dayzquery  # noqa
+from a2s.a2s_fragment import decode_fragment  # noqa
+from a2s.byteio import ByteReader  # noqa
+from a2s.defaults import DEFAULT_ENCODING  # noqa
+from a2s.exceptions import BrokenMessageError  # noqa
+from a2s.info import InfoProtocol  # noqa
+from a2s.rules import RulesProtocol  # noqa
+
+HEADER_SIMPLE = b"\xFF\xFF\xFF\xFF"
+HEADER_MULTI = b"\xFE\xFF\xFF\xFF"
+A2S_CHALLENGE_RESPONSE = 0x41
+MAX_CHALLENGES = 5
+MAX_INFLIGHT = 1024
+RCVBUF = 4 * 1024 * 1024
+CACHE_VERSION = 1
+LIMIT = 10000
+# shards that last returned more than this share of LIMIT are split
+# up front instead of waiting for them to come back truncated
+SPLIT_RATIO = 0.8
+SHARD_WORKERS = 8
+HTTP_TIMEOUT = 30.0
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.5
+HTTP_POOL_SIZE = 8
+HTTP_CHUNK = 64 * 1024
+# retried with backoff; anything else is returned to the caller
+HTTP_RETRY_STATUS = (429, 500, 502, 503, 504)
+STEAM_API_URL = "https://api.steampowered.com"
+BM_API_URL = "https://api.battlemetrics.com"
+LAN_TIMEOUT = 1.0
+BIT_TABLE = bytes.maketrans(b"01", b"\x00\x01")
+# pings older than PING_TTL are discarded; older than PING_REFRESH
+# they are still shown but re-measured on the next ping pass
+PING_TTL = 24 * 60 * 60
+PING_REFRESH = 15 * 60
+# background pinging: probes per second and servers per round trip
+PING_RATE = 200
+PING_BATCH = 50
+# probes per server when measuring round trips, and their spacing
+RTT_SAMPLES = 3
+RTT_SPACING = 0.2
+# per-server query timeouts (RFC 6298); unknown hosts get RTO_INITIAL
+# and one retry, a timeout doubles the RTO of a host with RTT history
+# until its next sample, and hosts that never answered or failed
+# RTO_DEAD_AFTER times in a row get a single attempt at RTO_INITIAL or
+# their own, unbacked RTO. All attempts of one query share RTO_BUDGET,
+# so a dead host costs at most 2.5 s; history older than RTT_TTL is
+# forgotten
+RTO_INITIAL = 1.0
+RTO_MIN = 0.2
+RTO_MAX = 2.0
+RTO_BUDGET = 2.5
+RTO_RETRIES = 1
+RTO_DEAD_AFTER = 2
+RTT_TTL = 7 * 24 * 60 * 60
+# replies reused for back-to-back queries of the same server
+QUERY_CACHE_TTL = 2.0
+QUERY_CACHE_SIZE = 4096
+# longest request line accepted by the query service
+QUERY_LINE_LIMIT = 64 * 1024
 
 params = [
     r"\nor\1\map\chernarusplus\nor\1\map\sakhal\nor\1\map\enoch\empty\1\nor\1\map\namalsk",  # noqa
@@ -28,6 +99,17 @@ params = [
     r"\map\enoch\noplayers\1",
 ]
 
+# predicates used to halve a shard that reaches LIMIT, in order of use;
+# each split yields the shard with and without (\nor) the predicate
+splits = [
+    r"\gametype\external",
+    r"\gametype\no3rd",
+    r"\gametype\mod",
+    r"\secure\1",
+    r"\linux\1",
+    r"\password\1",
+]
+
 
 class BmAPIError(Exception):
     pass
@@ -41,6 +123,14 @@ class InvalidIpError(Exception):
     pass
 
 
+class CacheError(Exception):
+    pass
+
+
+class HttpError(Exception):
+    pass
+
+
 def get_netmask() -> str:
     hostname = os.uname()[1]
     i = socket.gethostbyname(hostname)
@@ -48,30 +138,154 @@ def get_netmask() -> str:
     return netmask
 
 
-def test_ip(suffix: int, port: int) -> dict | None:
+def scan_lan(port: int) -> list:
+    """
+    Every host on the local /24 is queried directly rather than
+    pinged first; hosts that drop ICMP but answer A2S are found too
+    """
     netmask = get_netmask()
-    hostname = f"{netmask}.{str(suffix)}"
-    ping = ["ping", "-c1", "-i", "0.1", "-w", "1"]
-    output = subprocess.run(ping + [hostname], capture_output=True)
-    if output.returncode == 0:
-        return query_direct(hostname, port)
-    return None
+    records = [(f"{netmask}.{i}", port) for i in range(1, 256)]
+    return [res for res in query_many(records, LAN_TIMEOUT) if res]
+
+
+# control characters dropped anywhere in a server name
+sanitize_table = str.maketrans("", "", "\r\n\x01\ufeff")
+# leading '!' or '-' decorations (at most two) and whitespace
+sanitize_prefix = re.compile(r"^(?:!\s*|-\s*)?-?\s*")
+gametime_pattern = re.compile(r"[0-9]{2}:[0-9]{2}")
 
 
 def sanitize(name: str) -> str:
-    name = re.sub(r"\r", r"", name)
-    name = re.sub(r"\n", r"", name)
-    name = re.sub(r"\x01", r"", name)
-    name = re.sub(r"\ufeff", r"", name)
-    name = re.sub(r"(^!\s*)", r"-", name)
-    name = re.sub(r"(^-\s*)", r"", name)
-    name = re.sub(r"(^-)", r"", name)
-    name = re.sub(r"(^\s*)", r"", name)
-    name = re.sub(r"\t", "", name)
-    return name
+    name = name.translate(sanitize_table)
+    name = sanitize_prefix.sub("", name, count=1)
+    # tabs go last; a leading tab shields a '!' or '-' from the prefix
+    return name.replace("\t", "")
+
+
+@dataclass(slots=True, frozen=True)
+class Keywords:
+    view: str
+    provider: str
+    modded: bool
+    queue: int
+    time: str
+    battleye: bool
+    day_accel: float
+    night_accel: float
+
+
+def parse_accel(value: str) -> float:
+    try:
+        return float(f"{float(value):g}")
+    except ValueError:
+        return 0.0
 
 
-def parse_json(json: list) -> list:
+def parse_keywords(gametype: str) -> Keywords:
+    """
+    Single pass over the comma-separated gametype tags
+    """
+    view = "3PP"
+    provider = "Official"
+    modded = False
+    battleye = False
+    queue = None
+    gametime = None
+    day_accel = 0.0
+    night_accel = 0.0
+
+    for token in gametype.split(","):
+        match token:
+            case "no3rd":
+                view = "1PP"
+            case "external":
+                provider = "Unoffic."
+            case "mod":
+                modded = True
+            case "battleye":
+                battleye = True
+            case _:
+                if queue is None and "lqs" in token:
+                    try:
+                        queue = int(token.split("lqs")[1])
+                    except ValueError:
+                        queue = 0
+                elif token.startswith("entm"):
+                    night_accel = parse_accel(token[4:])
+                elif token.startswith("etm"):
+                    day_accel = parse_accel(token[3:])
+                if gametime is None and ":" in token:
+                    found = gametime_pattern.search(token)
+                    if found:
+                        gametime = found.group(0)
+
+    return Keywords(
+        view,
+        provider,
+        modded,
+        0 if queue is None else queue,
+        "Unknown" if gametime is None else gametime,
+        battleye,
+        day_accel,
+        night_accel,
+    )
+
+
+@dataclass(slots=True)
+class Server:
+    """
+    One row of a server table. Field order matches the columns of
+    the ListStore built by ModelManagerSingleton.new_model(); the
+    repeated map/perspective/time/provider strings are interned.
+    rtt carries the probe statistics behind ping once measured and
+    is not part of the column layout.
+    """
+
+    name: str
+    map: str
+    view: str
+    time: str
+    players: int
+    max_players: int
+    queue: int
+    addr: str
+    qport: int
+    ping: int
+    provider: str
+    modded: bool
+    rtt: "RttStats | None" = None
+
+    @classmethod
+    def from_list(cls, row: list) -> "Server":
+        server = cls(*row)
+        server.map = sys.intern(server.map)
+        server.view = sys.intern(server.view)
+        server.time = sys.intern(server.time)
+        server.provider = sys.intern(server.provider)
+        return server
+
+    def as_tuple(self) -> tuple:
+        return (
+            self.name,
+            self.map,
+            self.view,
+            self.time,
+            self.players,
+            self.max_players,
+            self.queue,
+            self.addr,
+            self.qport,
+            self.ping,
+            self.provider,
+            self.modded,
+        )
+
+    def update(self, other: "Server") -> None:
+        for name in self.__slots__:
+            setattr(self, name, getattr(other, name))
+
+
+def parse_json(json: list) -> list[Server]:
     """
     Server metadata is underspecified and server operators
     tend to insert random garbage in the headers. In case
@@ -80,144 +294,1277 @@ def parse_json(json: list) -> list:
     """
     rows = []
     for row in json:
-        try:
-            name = sanitize(row["name"])
-            if name == "":
-                continue
-        except KeyError:
-            continue
+        raw = parse_row(row)
+        if raw is not None:
+            rows.append(raw)
+    return rows
 
-        malformed = False
-        for key in [
-            "map",
-            "gametype",
-            "players",
-            "max_players",
-            "addr",
-            "gameport",
-        ]:
-            try:
-                row[key]
-            except KeyError:
-                malformed = True
-                break
 
-        if malformed is True:
-            continue
+def parse_row(row: dict) -> Server | None:
+    try:
+        name = sanitize(row["name"])
+        if name == "":
+            return None
+    except (KeyError, TypeError, AttributeError):
+        return None
 
-        try:
-            r = row["gametype"].split(",")
-        except KeyError:
-            continue
+    for key in [
+        "map",
+        "gametype",
+        "players",
+        "max_players",
+        "addr",
+        "gameport",
+    ]:
+        if key not in row:
+            return None
 
-        if "no3rd" in r:
-            view = "1PP"
-        else:
-            view = "3PP"
+    try:
+        keywords = parse_keywords(row["gametype"])
+    except AttributeError:
+        return None
 
-        if "external" in r:
-            provider = "Unoffic."
-        else:
-            provider = "Official"
+    try:
+        ip = row["addr"].split(":")[0] + ":" + str(row["gameport"])
+        qport = row["addr"].split(":")[1]
+    except (IndexError, AttributeError):
+        return None
 
-        if "mod" in r:
-            modded = True
-        else:
-            modded = False
+    try:
+        ping = row["ping"]
+    except KeyError:
+        ping = 9999
 
-        try:
-            r = row["gametype"].split("lqs")
-            queue = r[1].split(",")[0]
-        except IndexError:
-            queue = 0
+    try:
+        return Server(
+            name,
+            sys.intern(row["map"].lower()),
+            keywords.view,
+            sys.intern(keywords.time),
+            int(row["players"]),
+            int(row["max_players"]),
+            keywords.queue,
+            ip,
+            int(qport),
+            ping,
+            keywords.provider,
+            keywords.modded,
+        )
+    except (ValueError, TypeError, AttributeError):
+        return None
 
-        try:
-            test_time = re.search(r"[0-9]{2}:[0-9]{2}", row["gametype"])
-            if test_time:
-                time = test_time.group(0)
+
+def to_mask(flags: typing.Iterable[bool]) -> int:
+    """Packs per-row booleans into an int bitset, bit i for row i"""
+    bits = "".join("1" if f else "0" for f in flags)
+    if not bits:
+        return 0
+    return int(bits[::-1], 2)
+
+
+def index_mask(indices: list[int], size: int) -> int:
+    """Packs a list of row indices into an int bitset"""
+    buf = bytearray((size + 7) // 8)
+    for i in indices:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, "little")
+
+
+def mask_bytes(mask: int) -> bytes:
+    """Unpacks an int bitset into one 0/1 byte per row, row 0 first"""
+    return bin(mask)[:1:-1].encode().translate(BIT_TABLE)
+
+
+def from_mask(mask: int) -> list[int]:
+    """Unpacks an int bitset into ascending row indices"""
+    bits = mask_bytes(mask)
+    return list(compress(range(len(bits)), bits))
+
+
+@dataclass(slots=True, frozen=True)
+class DedupSpec:
+    """
+    How the Duplicate filter identifies copies and which one it keeps.
+
+    identity: "name", "normalized" (case and symbols ignored), "ip"
+    or "addr" (IP and game port). survivor: "first" (list order),
+    "ping" (lowest ping) or "population" (most players).
+    """
+
+    identity: str = "name"
+    survivor: str = "first"
+
+
+def trigram_index(haystacks: list[str]) -> dict[str, array]:
+    """Maps every trigram to the ascending indices of strings holding it"""
+    index = {}
+    for i, hay in enumerate(haystacks):
+        for gram in {hay[j : j + 3] for j in range(len(hay) - 2)}:
+            posting = index.get(gram)
+            if posting is None:
+                index[gram] = posting = array("I")
+            posting.append(i)
+    return index
+
+
+class ServerTable:
+    """
+    Column-wise view of the control model. Every checkbox filter is
+    precomputed as a bitset of the rows it removes, so any filter
+    combination resolves with AND/ANDNOT over Python ints.
+
+    Rows are never reindexed: remove() clears the row from the live
+    bitset and update() patches the bitsets and sorted indexes of a
+    single row in place.
+    """
+
+    # filters that cannot both be unchecked without emptying the table
+    opposed = {"3PP": "1PP", "Day": "Night", "Official": "Unoffic."}
+    day = re.compile(r"([0][0-9]|[1][0-6])")
+    night = re.compile(r"([0][0-4]|[1][8]|[2][0-3])")
+    punctuation = re.compile(r"[^A-Za-z0-9]+")
+    symbols = re.compile(r"[\W_]+")
+
+    def __init__(self, rows: list[Server], searchable: bool = True):
+        self.rows = rows
+        self.size = len(rows)
+        # live rows; removed rows keep their index as tombstones
+        self.all = (1 << self.size) - 1
+        self.addresses = {
+            (row.addr, row.qport): i for i, row in enumerate(rows)
+        }
+        self.players = array("i", [row.players for row in rows])
+        self.max_players = array("i", [row.max_players for row in rows])
+
+        players = self.players
+        max_players = self.max_players
+        self.masks = {
+            "3PP": to_mask(row.view == "3PP" for row in rows),
+            "1PP": to_mask(row.view == "1PP" for row in rows),
+            "Official": to_mask(row.provider == "Official" for row in rows),
+            "Unoffic.": to_mask(row.provider == "Unoffic." for row in rows),
+            "Empty": to_mask(p == 0 for p in players),
+            "Full": to_mask(p == m for p, m in zip(players, max_players)),
+            "Day": to_mask(self.day.match(row.time) for row in rows),
+            "Night": to_mask(self.night.match(row.time) for row in rows),
+            "Non-ASCII": to_mask(not row.name.isascii() for row in rows),
+            "Low pop": to_mask(
+                p * 100 <= m * 30 for p, m in zip(players, max_players)
+            ),
+            "Modded": to_mask(row.modded for row in rows),
+        }
+
+        maps = {}
+        for i, row in enumerate(rows):
+            maps.setdefault(row.map, []).append(i)
+        self.maps = {m: index_mask(v, self.size) for m, v in maps.items()}
+
+        # DedupSpec -> groups of rows sharing an identity
+        self.duplicates = {}
+        # maps are few and shared, so only name and address are indexed
+        self.haystacks = [f"{row.name}\0{row.addr}".lower() for row in rows]
+        # transient tables (e.g. streaming previews) skip the index
+        self.trigrams = trigram_index(self.haystacks) if searchable else None
+        self.keywords = {}
+        # numeric columns sorted on first use by a range filter
+        self.ranges = {}
+        self.range_masks = {}
+        self.distance = {}
+        self.distances_from = -1
+        if searchable:
+            for name in ("ping", "players", "queue"):
+                self.sorted_index(name)
+            self.duplicate_groups(DedupSpec())
+        # string sort keys by field, filled lazily except for names
+        self.sort_keys = {
+            "name": [
+                self.punctuation.sub("", row.name.lower()) for row in rows
+            ]
+        }
+
+    def identity(self, identity: str) -> typing.Callable[[Server], str]:
+        match identity:
+            case "normalized":
+                return lambda row: self.symbols.sub("", row.name.casefold())
+            case "ip":
+                return lambda row: row.addr.split(":")[0]
+            case "addr":
+                return lambda row: row.addr
+            case _:
+                return lambda row: row.name
+
+    def duplicate_groups(self, spec: "DedupSpec") -> list[list[int]]:
+        """
+        Groups rows sharing an identity, each ordered by survivor
+        preference. Rows with a unique identity are left out.
+        """
+        if spec in self.duplicates:
+            return self.duplicates[spec]
+        key = self.identity(spec.identity)
+        groups = {}
+        for i, row in enumerate(self.rows):
+            groups.setdefault(key(row), []).append(i)
+        groups = [v for v in groups.values() if len(v) > 1]
+        if spec.survivor != "first":
+            preference = self.survivor_key(spec.survivor)
+            for group in groups:
+                group.sort(key=preference)
+        self.duplicates[spec] = groups
+        return groups
+
+    def survivor_key(self, survivor: str) -> typing.Callable[[int], tuple]:
+        # list order breaks ties, keeping the choice stable
+        rows = self.rows
+        match survivor:
+            case "ping":
+                return lambda i: (rows[i].ping, i)
+            case "population":
+                return lambda i: (-rows[i].players, i)
+            case _:
+                return lambda i: (i,)
+
+    def dedup(self, mask: int, spec: "DedupSpec") -> int:
+        """Keeps the preferred row of each identity that survives mask"""
+        bits = mask_bytes(mask)
+        culled = []
+        for group in self.duplicate_groups(spec):
+            first = True
+            for i in group:
+                if i >= len(bits) or not bits[i]:
+                    continue
+                if first:
+                    first = False
+                else:
+                    culled.append(i)
+        return mask & ~index_mask(culled, self.size)
+
+    def keyword_mask(self, keyword: str) -> int:
+        """Bitset of rows whose name, map or address contains keyword"""
+        if keyword in self.keywords:
+            return self.keywords[keyword]
+
+        haystacks = self.haystacks
+        if len(keyword) < 3 or self.trigrams is None:
+            mask = to_mask(keyword in hay for hay in haystacks)
+        else:
+            # verify against the rarest trigram's postings
+            postings = []
+            for i in range(len(keyword) - 2):
+                posting = self.trigrams.get(keyword[i : i + 3])
+                if posting is None:
+                    postings = []
+                    break
+                postings.append(posting)
+            shortest = min(postings, key=len, default=())
+            hits = [i for i in shortest if keyword in haystacks[i]]
+            mask = index_mask(hits, self.size)
+
+        for m, bits in self.maps.items():
+            if keyword in m:
+                mask |= bits
+        self.keywords[keyword] = mask
+        return mask
+
+    def resolve(self, filters: tuple, narrow: bool = True) -> int:
+        """
+        Returns the bitset of rows passing a FilterPanel.get_filters()
+        tuple. Duplicates are culled last, so the surviving row of a
+        group is chosen among rows that pass every other filter.
+        """
+        sel_map, keyword, *rest = filters
+        unchecked = [f for f in rest if isinstance(f, str)]
+        spec = next((f for f in rest if isinstance(f, DedupSpec)), None)
+        for k, v in self.opposed.items():
+            if k in unchecked and v in unchecked:
+                return 0
+
+        mask = self.all
+        if narrow:
+            if sel_map != "All maps":
+                mask &= self.maps.get(sel_map, 0)
+            if keyword != "":
+                mask &= self.keyword_mask(keyword)
+        # (field, low, high) tuples from the range filters
+        for f in rest:
+            if isinstance(f, tuple):
+                mask &= self.range_mask(*f)
+
+        for f in unchecked:
+            if f != "Duplicate":
+                mask &= ~self.masks[f]
+        if "Duplicate" in unchecked:
+            mask = self.dedup(mask, spec or DedupSpec())
+        return mask
+
+    def set_distances(self, known: dict) -> None:
+        """
+        Fills the sparse distance column from an IP -> km mapping.
+        Rows without a numeric distance never pass a distance range.
+        """
+        self.distance = {}
+        self.distances_from = len(known)
+        for i, row in enumerate(self.rows):
+            km = known.get(row.addr.split(":")[0])
+            try:
+                self.distance[i] = int(km)
+            except (TypeError, ValueError):
+                continue
+        self.invalidate("distance")
+
+    def find(self, addr: str, qport: int) -> int | None:
+        i = self.addresses.get((addr, qport))
+        if i is None or not self.is_live(i):
+            return None
+        return i
+
+    def is_live(self, i: int) -> bool:
+        return bool(self.all >> i & 1)
+
+    def live_rows(self) -> list[Server]:
+        return list(compress(self.rows, mask_bytes(self.all)))
+
+    def remove(self, i: int) -> None:
+        """
+        Tombstones row i. Every bitset is ANDed with the live set on
+        resolve, so cached masks and indexes stay valid as they are.
+        """
+        self.all &= ~(1 << i)
+
+    def update(self, i: int, field: str) -> None:
+        """Re-indexes row i after Server.<field> changed in place"""
+        row = self.rows[i]
+        bit = 1 << i
+        if field == "players":
+            self.players[i] = row.players
+            flags = {
+                "Empty": row.players == 0,
+                "Full": row.players == row.max_players,
+                "Low pop": row.players * 100 <= row.max_players * 30,
+            }
+            for label, flag in flags.items():
+                if flag:
+                    self.masks[label] |= bit
+                else:
+                    self.masks[label] &= ~bit
+
+        value = getattr(row, field)
+        if field in self.ranges:
+            values, order = self.ranges[field]
+            pos = order.index(i)
+            del values[pos]
+            del order[pos]
+            pos = bisect.bisect_right(values, value)
+            values.insert(pos, value)
+            order.insert(pos, i)
+        for key in self.range_masks:
+            if key[0] != field:
+                continue
+            if key[1] <= value <= key[2]:
+                self.range_masks[key] |= bit
             else:
-                time = "Unknown"
-        except AttributeError:
-            time = "Unknown"
+                self.range_masks[key] &= ~bit
 
-        try:
-            ip = row["addr"].split(":")[0] + ":" + str(row["gameport"])
-            qport = row["addr"].split(":")[1]
-        except IndexError:
-            continue
+        survivor = {"ping": "ping", "players": "population"}.get(field)
+        for spec, groups in self.duplicates.items():
+            if spec.survivor != survivor:
+                continue
+            for group in groups:
+                if i in group:
+                    group.sort(key=self.survivor_key(survivor))
+                    break
+
+    def passes(self, i: int, filters: tuple) -> bool:
+        """
+        Whether row i passes a filter tuple, tested on its own bits.
+        Not meaningful for tuples that cull duplicates.
+        """
+        if not self.is_live(i):
+            return False
+        sel_map, keyword, *rest = filters
+        row = self.rows[i]
+        if sel_map != "All maps" and row.map != sel_map:
+            return False
+        if keyword != "" and not self.keyword_mask(keyword) >> i & 1:
+            return False
+        for f in rest:
+            if isinstance(f, tuple):
+                if not self.range_mask(*f) >> i & 1:
+                    return False
+            elif isinstance(f, str) and f in self.masks:
+                if self.masks[f] >> i & 1:
+                    return False
+        unchecked = [f for f in rest if isinstance(f, str)]
+        for k, v in self.opposed.items():
+            if k in unchecked and v in unchecked:
+                return False
+        return True
+
+    def invalidate(self, field: str) -> None:
+        """Drops the indexes derived from a column whose values changed"""
+        self.ranges.pop(field, None)
+        for key in [k for k in self.range_masks if k[0] == field]:
+            del self.range_masks[key]
+        survivor = {"ping": "ping", "players": "population"}.get(field)
+        for spec in [s for s in self.duplicates if s.survivor == survivor]:
+            del self.duplicates[spec]
+
+    def sorted_index(self, field: str) -> tuple[array, array]:
+        """Column values in ascending order and their row indices"""
+        if field not in self.ranges:
+            if field == "distance":
+                column = self.distance
+                order = sorted(column, key=column.__getitem__)
+            else:
+                column = [getattr(row, field) for row in self.rows]
+                order = sorted(range(self.size), key=column.__getitem__)
+            values = array("q", [column[i] for i in order])
+            self.ranges[field] = (values, array("I", order))
+        return self.ranges[field]
+
+    def range_mask(self, field: str, low: int, high: int) -> int:
+        """Bitset of rows with low <= field <= high, by binary search"""
+        key = (field, low, high)
+        if key not in self.range_masks:
+            values, order = self.sorted_index(field)
+            start = bisect.bisect_left(values, low)
+            end = bisect.bisect_right(values, high)
+            self.range_masks[key] = index_mask(order[start:end], self.size)
+        return self.range_masks[key]
+
+    def key(self, field: str) -> typing.Callable[[int], typing.Any]:
+        """Sort key over row indices for one Server field"""
+        if field in self.sort_keys:
+            return self.sort_keys[field].__getitem__
+        rows = self.rows
+        if Server.__annotations__[field] is str:
+            keys = [getattr(row, field).casefold() for row in rows]
+            self.sort_keys[field] = keys
+            return keys.__getitem__
+        # numeric fields (players, ping, ...) change in place
+        return lambda i: getattr(rows[i], field)
+
+    def sort(
+        self, index: typing.Iterable[int], spec: list[tuple[str, bool]]
+    ) -> list[int]:
+        """
+        Returns index ordered by spec, a list of (field, descending)
+        pairs with the primary key first, e.g.
+        [("map", False), ("players", True), ("ping", False)]
+        """
+        order = list(index)
+        for name, descending in reversed(spec):
+            order.sort(key=self.key(name), reverse=descending)
+        return order
+
+    def indices(self, filters: tuple, narrow: bool = True) -> list[int]:
+        return from_mask(self.resolve(filters, narrow))
+
+    def select(self, filters: tuple, narrow: bool = True) -> list[Server]:
+        mask = self.resolve(filters, narrow)
+        return list(compress(self.rows, mask_bytes(mask)))
+
+
+class ServerListDecoder:
+    """
+    Incrementally decodes a GetServerList response body. Each server
+    object is turned into a parsed row as soon as it has been read off
+    the wire and then discarded, so the full dict tree for a shard is
+    never held in memory.
+    """
 
+    SEEK = 0
+    ARRAY = 1
+    DONE = 2
+
+    list_start = re.compile(r'"servers"\s*:\s*\[')
+    separator = re.compile(r"[\s,]*")
+
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.text = codecs.getincrementaldecoder("utf-8")("replace")
+        self.state = self.SEEK
+        self.buf = ""
+        self.pos = 0
+        self.rows: list = []
+        self.count = 0
+
+    def feed(self, chunk: bytes, final: bool = False) -> None:
+        if self.state == self.DONE:
+            return
+        self.buf = self.buf[self.pos:] + self.text.decode(chunk, final)
+        self.pos = 0
+
+        if self.state == self.SEEK:
+            match = self.list_start.search(self.buf)
+            if match is None:
+                return
+            self.pos = match.end()
+            self.state = self.ARRAY
+
+        while True:
+            self.pos = self.separator.match(self.buf, self.pos).end()
+            if self.pos >= len(self.buf):
+                return
+            if self.buf[self.pos] == "]":
+                self.state = self.DONE
+                self.buf = ""
+                return
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.decoder.JSONDecodeError:
+                # object continues in the next chunk
+                if final:
+                    raise
+                return
+            self.pos = end
+            self.count += 1
+            row = parse_row(obj)
+            if row is not None:
+                self.rows.append(row)
+
+    def close(self) -> None:
+        self.feed(b"", final=True)
+        match self.state:
+            case self.SEEK:
+                # no server list at all; valid for empty results only
+                body = json.loads(self.buf)
+                if not isinstance(body, dict) or "response" not in body:
+                    raise json.decoder.JSONDecodeError(
+                        "Missing response object", self.buf, 0
+                    )
+            case self.ARRAY:
+                raise json.decoder.JSONDecodeError(
+                    "Unterminated server list", self.buf, self.pos
+                )
+
+
+def cache_age(path: str) -> float | None:
+    try:
+        return time.time() - os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def save_rows(rows: list[Server], path: str) -> None:
+    """
+    Rows are written to a temporary file first so that a reader
+    never observes a partially written cache
+    """
+    payload = {
+        "version": CACHE_VERSION,
+        "rows": [row.as_tuple() for row in rows],
+    }
+    temp = f"{path}.tmp"
+    try:
+        with gzip.open(temp, "wt", encoding="utf-8") as outfile:
+            json.dump(payload, outfile, separators=(",", ":"))
+        os.replace(temp, path)
+    except (OSError, TypeError) as e:
+        raise CacheError(f"Failed to write server cache: {e}")
+
+
+def load_rows(path: str, max_age: float) -> list[Server] | None:
+    age = cache_age(path)
+    if age is None or age > max_age:
+        return None
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as infile:
+            payload = json.load(infile)
+    except (OSError, EOFError, json.decoder.JSONDecodeError):
+        return None
+
+    if not isinstance(payload, dict):
+        return None
+    if payload.get("version") != CACHE_VERSION:
+        return None
+    rows = payload.get("rows")
+    if not rows:
+        return None
+    try:
+        return [Server.from_list(row) for row in rows]
+    except TypeError:
+        return None
+
+
+class PingCache:
+    """
+    Ping results keyed by "ip:gameport" with the time they were
+    measured, persisted across sessions. Thread-safe.
+    """
+
+    def __init__(
+        self, path: str, ttl: float = PING_TTL, refresh: float = PING_REFRESH
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.refresh = refresh
+        self.entries = {}
+        self.loaded = False
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def load(self) -> None:
+        """Reads the store once; expired entries are dropped"""
+        with self.lock:
+            if self.loaded:
+                return
+            self.loaded = True
+            try:
+                with open(self.path, "r") as infile:
+                    payload = json.load(infile)
+            except (OSError, json.decoder.JSONDecodeError):
+                return
+            if not isinstance(payload, dict):
+                return
+            if payload.get("version") != CACHE_VERSION:
+                return
+            now = time.time()
+            for addr, entry in payload.get("pings", {}).items():
+                try:
+                    ping, stamp = int(entry[0]), float(entry[1])
+                except (TypeError, ValueError, IndexError):
+                    continue
+                if now - stamp < self.ttl:
+                    self.entries[addr] = (ping, stamp)
+
+    def get(self, addr: str) -> int | None:
+        self.load()
+        entry = self.entries.get(addr)
+        if entry is None or time.time() - entry[1] >= self.ttl:
+            return None
+        return entry[0]
+
+    def put(self, addr: str, ping: int, stamp: float | None = None) -> None:
+        self.load()
+        with self.lock:
+            if stamp is None:
+                stamp = time.time()
+            self.entries[addr] = (ping, stamp)
+            self.dirty = True
+
+    def needs_refresh(self, addr: str) -> bool:
+        self.load()
+        entry = self.entries.get(addr)
+        return entry is None or time.time() - entry[1] >= self.refresh
+
+    def merge(self, rows: list[Server]) -> int:
+        """Fills unmeasured rows from the store; returns rows filled"""
+        self.load()
+        filled = 0
+        for row in rows:
+            if row.ping != 9999:
+                continue
+            ping = self.get(row.addr)
+            if ping is not None:
+                row.ping = ping
+                filled += 1
+        return filled
+
+    def save(self) -> None:
+        """Writes unexpired entries through a temporary file"""
+        with self.lock:
+            if not self.dirty:
+                return
+            now = time.time()
+            pings = {
+                addr: [ping, stamp]
+                for addr, (ping, stamp) in self.entries.items()
+                if now - stamp < self.ttl
+            }
+            self.dirty = False
+        payload = {"version": CACHE_VERSION, "pings": pings}
+        temp = f"{self.path}.tmp"
         try:
-            ping = row["ping"]
-        except KeyError:
-            ping = 9999
-
-        mapname = row["map"].lower()
-        players = row["players"]
-        max_players = row["max_players"]
-        raw = [
-            name,
-            mapname,
-            view,
-            time,
-            int(players),
-            int(max_players),
-            int(queue),
-            ip,
-            int(qport),
-            ping,
-            provider,
-            modded,
-        ]
-        rows.append(raw)
-    return rows
+            with open(temp, "w") as outfile:
+                json.dump(payload, outfile, separators=(",", ":"))
+            os.replace(temp, self.path)
+        except OSError as e:
+            raise CacheError(f"Failed to write ping cache: {e}")
 
 
-def query_direct(ip: str, qport: int, TIMEOUT: float=3.0) -> dict | None:
+def info_to_dict(ip: str, qport: int, info: a2s.SourceInfo) -> dict:
     try:
-        info = a2s.info((ip, qport), TIMEOUT)
+        ping = math.floor(info.ping * 1000)
+    except (AttributeError, TypeError):
+        ping = 9999
+
+    res = {}
+    res["name"] = info.server_name
+    res["map"] = info.map_name
+    res["gametype"] = info.keywords
+    res["players"] = info.player_count
+    res["max_players"] = info.max_players
+    res["addr"] = ip + ":" + str(qport)
+    res["gameport"] = str(info.port)
+    res["ping"] = ping
+    return res
 
-        name = info.server_name
-        mapname = info.map_name
-        address = ip + ":" + str(qport)
-        gameport = str(info.port)
-        players = info.player_count
-        max_players = info.max_players
-        keywords = info.keywords
 
+class RttEstimator:
+    """
+    Smoothed round trip time and its variance per query address
+    ("ip:qport"), from which a retransmission timeout is derived
+    the way TCP does. Optionally persisted. Thread-safe.
+    """
+
+    alpha = 1 / 8
+    beta = 1 / 4
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+        # addr -> [srtt, rttvar, consecutive failures, last sample]
+        self.entries = {}
+        self.loaded = path is None
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def load(self) -> None:
+        """Reads the store once; stale entries are dropped"""
+        with self.lock:
+            if self.loaded:
+                return
+            self.loaded = True
+            try:
+                with open(self.path, "r") as infile:
+                    payload = json.load(infile)
+            except (OSError, json.decoder.JSONDecodeError):
+                return
+            if not isinstance(payload, dict):
+                return
+            if payload.get("version") != CACHE_VERSION:
+                return
+            now = time.time()
+            for addr, entry in payload.get("rtt", {}).items():
+                try:
+                    srtt, rttvar, failures, stamp = entry
+                    if srtt is not None:
+                        srtt, rttvar = float(srtt), float(rttvar)
+                    failures, stamp = int(failures), float(stamp)
+                except (TypeError, ValueError):
+                    continue
+                if now - stamp < RTT_TTL:
+                    self.entries[addr] = [srtt, rttvar, failures, stamp]
+
+    def sample(self, addr: str, rtt: float) -> None:
+        self.load()
+        with self.lock:
+            entry = self.entries.get(addr)
+            if entry is None or entry[0] is None:
+                srtt, rttvar = rtt, rtt / 2
+            else:
+                srtt, rttvar = entry[0], entry[1]
+                rttvar += self.beta * (abs(srtt - rtt) - rttvar)
+                srtt += self.alpha * (rtt - srtt)
+            self.entries[addr] = [srtt, rttvar, 0, time.time()]
+            self.dirty = True
+
+    def failure(self, addr: str) -> None:
+        """
+        Counts a timed out query. The timestamp is left alone so
+        unreachable hosts still expire.
+        """
+        self.load()
+        with self.lock:
+            entry = self.entries.get(addr)
+            if entry is None:
+                self.entries[addr] = [None, None, 1, time.time()]
+            else:
+                entry[2] += 1
+            self.dirty = True
+
+    def timeout(self, addr: str) -> float:
+        self.load()
+        entry = self.entries.get(addr)
+        if entry is None or entry[0] is None:
+            return RTO_INITIAL
+        srtt, rttvar, failures, _ = entry
+        rto = min(max(srtt + 4 * rttvar, RTO_MIN), RTO_MAX)
+        if failures < RTO_DEAD_AFTER:
+            # back off until the next sample (RFC 6298 5.5)
+            rto = min(rto * 2**failures, RTO_MAX)
+        return rto
+
+    def retries(self, addr: str) -> int:
+        self.load()
+        entry = self.entries.get(addr)
+        if entry is None:
+            return RTO_RETRIES
+        if entry[0] is None or entry[2] >= RTO_DEAD_AFTER:
+            return 0
+        return RTO_RETRIES
+
+    def save(self) -> None:
+        """Writes recent entries through a temporary file"""
+        if self.path is None:
+            return
+        with self.lock:
+            if not self.dirty:
+                return
+            now = time.time()
+            entries = {
+                addr: entry
+                for addr, entry in self.entries.items()
+                if now - entry[3] < RTT_TTL
+            }
+            self.dirty = False
+        payload = {"version": CACHE_VERSION, "rtt": entries}
+        temp = f"{self.path}.tmp"
         try:
-            ping = info.ping
-            ping = math.floor(info.ping * 1000)
-        except AttributeError:
-            ping = 9999
-
-        res = {}
-        res["name"] = name
-        res["map"] = mapname
-        res["gametype"] = keywords
-        res["players"] = players
-        res["max_players"] = max_players
-        res["addr"] = address
-        res["gameport"] = gameport
-        res["ping"] = ping
-        return res
+            with open(temp, "w") as outfile:
+                json.dump(payload, outfile, separators=(",", ":"))
+            os.replace(temp, self.path)
+        except OSError as e:
+            raise CacheError(f"Failed to write RTT cache: {e}")
+
+
+def query_direct(
+    ip: str, qport: int, TIMEOUT: float | None = None
+) -> dict | None:
+    try:
+        info = engine.info((ip, int(qport)), TIMEOUT)
+        return info_to_dict(ip, qport, info)
     except TimeoutError:
         return None
-    except KeyError:
+    except (KeyError, AttributeError, BrokenMessageError, OSError):
         return None
 
 
+def query_many(
+    records: list[tuple[str, int]], TIMEOUT: float | None = None
+) -> list[dict | None]:
+    """
+    Bulk counterpart of query_direct; results are returned in the
+    order of the input records, with None for failed queries
+    """
+    infos = engine.info_many(records, TIMEOUT)
+    results: list[dict | None] = []
+    for record, info in zip(records, infos):
+        if info is None:
+            results.append(None)
+            continue
+        try:
+            results.append(info_to_dict(record[0], record[1], info))
+        except (KeyError, AttributeError):
+            results.append(None)
+    return results
+
+
+@dataclass(slots=True)
+class Query:
+    addr: tuple[str, int]
+    proto: typing.Any
+    encoding: str | None
+    future: asyncio.Future
+    released: asyncio.Event
+    sent: float = 0.0
+    ping: float | None = None
+    challenges: int = 0
+    fragments: list = dc_field(default_factory=list)
+
+
+class QueryEndpoint(asyncio.DatagramProtocol):
+    """
+    One shared UDP socket for a given A2S request type. The server
+    answers from the address we sent to, so responses are matched
+    to their pending query by source address alone.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.pending: dict[tuple[str, int], Query] = {}
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def error_received(self, exc: Exception) -> None:
+        # ICMP errors on an unconnected socket cannot be attributed to
+        # a query reliably; the per-query deadline covers these hosts
+        pass
+
+    def send(self, query: Query, challenge: int = 0) -> None:
+        payload = HEADER_SIMPLE + query.proto.serialize_request(challenge)
+        if query.sent == 0.0:
+            query.sent = time.monotonic()
+        self.transport.sendto(payload, query.addr)
+
+    def datagram_received(self, packet: bytes, addr: tuple) -> None:
+        query = self.pending.get((addr[0], addr[1]))
+        if query is None or query.future.done():
+            return
+        if query.ping is None:
+            query.ping = time.monotonic() - query.sent
+
+        try:
+            header = packet[:4]
+            payload = packet[4:]
+            if header == HEADER_MULTI:
+                query.fragments.append(decode_fragment(payload))
+                if len(query.fragments) < query.fragments[0].fragment_count:
+                    return
+                query.fragments.sort(key=lambda f: f.fragment_id)
+                payload = b"".join(f.payload for f in query.fragments)
+                query.fragments = []
+                if payload.startswith(HEADER_SIMPLE):
+                    payload = payload[4:]
+            elif header != HEADER_SIMPLE:
+                raise BrokenMessageError(f"Invalid packet header: {header!r}")
+            self._process(query, payload)
+        except Exception as e:
+            query.future.set_exception(e)
+
+    def _process(self, query: Query, payload: bytes) -> None:
+        reader = ByteReader(
+            io.BytesIO(payload), endian="<", encoding=query.encoding
+        )
+        response_type = reader.read_uint8()
+        if response_type == A2S_CHALLENGE_RESPONSE:
+            if query.challenges >= MAX_CHALLENGES:
+                raise BrokenMessageError(
+                    "Server keeps sending challenge responses"
+                )
+            query.challenges += 1
+            self.send(query, reader.read_uint32())
+            return
+
+        if not query.proto.validate_response_type(response_type):
+            raise BrokenMessageError(
+                f"Invalid response type: {hex(response_type)}"
+            )
+        res = query.proto.deserialize_response(reader, response_type, query.ping)
+        query.future.set_result(res)
+
+
+class QueryEngine:
+    """
+    Asynchronous A2S client that multiplexes any number of in-flight
+    queries over one UDP socket per request type. Duplicate queries
+    share one round trip (see fetch()). The event loop runs on a
+    daemon thread so that the blocking helpers below can be called
+    from the UI worker threads.
+
+    Thread-safe.
+    """
+
+    def __init__(self, max_inflight: int = MAX_INFLIGHT):
+        self.max_inflight = max_inflight
+        # timeouts left as None are derived from this, per server
+        self.rtt = RttEstimator()
+        # (proto, ip, qport) -> shared request / (time, reply);
+        # both are only touched from the event loop thread
+        self.inflight: dict[tuple, asyncio.Future] = {}
+        self.results: dict[tuple, tuple[float, typing.Any]] = {}
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.endpoints: dict[typing.Any, QueryEndpoint] = {}
+        self.lock = threading.Lock()
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        with self.lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, daemon=True)
+                thread.start()
+                future = asyncio.run_coroutine_threadsafe(self._open(), loop)
+                future.result()
+                self.loop = loop
+        return self.loop
+
+    async def _open(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.semaphore = asyncio.Semaphore(self.max_inflight)
+        for proto in InfoProtocol, RulesProtocol:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF)
+            except OSError:
+                pass
+            sock.bind(("0.0.0.0", 0))
+            sock.setblocking(False)
+            _, endpoint = await loop.create_datagram_endpoint(
+                QueryEndpoint, sock=sock
+            )
+            self.endpoints[proto] = endpoint
+
+    def run(self, coro: typing.Coroutine) -> typing.Any:
+        loop = self._start()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    async def request(
+        self,
+        addr: tuple[str, int],
+        proto: typing.Any,
+        timeout: float | None = None,
+        encoding: str | None = DEFAULT_ENCODING,
+        retries: int | None = None,
+        backoff: bool = True,
+    ) -> typing.Any:
+        """
+        Without an explicit timeout, the timeout and number of
+        retries come from the server's RTT history, and all attempts
+        together wait at most RTO_BUDGET. Unless backoff is False, a
+        final timeout counts against the server in that history.
+        """
+        loop = asyncio.get_running_loop()
+        host, port = addr
+        try:
+            socket.inet_aton(host)
+        except OSError:
+            infos = await loop.getaddrinfo(
+                host, port, family=socket.AF_INET, type=socket.SOCK_DGRAM
+            )
+            host = infos[0][4][0]
+        addr = (host, int(port))
+        key = f"{host}:{port}"
+
+        adaptive = timeout is None
+        if adaptive:
+            timeout = self.rtt.timeout(key)
+        if retries is None:
+            retries = self.rtt.retries(key) if adaptive else 0
+
+        spent = 0.0
+        for attempt in range(retries + 1):
+            try:
+                res, rtt = await self._send(addr, proto, encoding, timeout)
+            except TimeoutError:
+                spent += timeout
+                if attempt == retries or adaptive and spent >= RTO_BUDGET:
+                    if adaptive and backoff:
+                        self.rtt.failure(key)
+                    raise
+                timeout = min(timeout * 2, RTO_MAX)
+                if adaptive:
+                    timeout = min(timeout, RTO_BUDGET - spent)
+                continue
+            # a reply after a retry may answer the earlier attempt,
+            # so only first attempts are sampled (Karn's algorithm)
+            if attempt == 0 and rtt is not None:
+                self.rtt.sample(key, rtt)
+            return res
+
+    async def _send(
+        self,
+        addr: tuple[str, int],
+        proto: typing.Any,
+        encoding: str | None,
+        timeout: float,
+    ) -> tuple[typing.Any, float | None]:
+        loop = asyncio.get_running_loop()
+        endpoint = self.endpoints[proto]
+
+        async with self.semaphore:
+            # one outstanding request per address and socket, otherwise
+            # the responses could not be told apart
+            while addr in endpoint.pending:
+                await endpoint.pending[addr].released.wait()
+
+            query = Query(
+                addr, proto, encoding, loop.create_future(), asyncio.Event()
+            )
+            endpoint.pending[addr] = query
+            try:
+                endpoint.send(query)
+                res = await asyncio.wait_for(query.future, timeout)
+                return res, query.ping
+            finally:
+                del endpoint.pending[addr]
+                query.released.set()
+
+    async def fetch(
+        self,
+        addr: tuple[str, int],
+        proto: typing.Any,
+        timeout: float | None = None,
+        encoding: str | None = DEFAULT_ENCODING,
+    ) -> typing.Any:
+        """
+        request() shared between callers: concurrent queries of the
+        same type to the same server join one in-flight request, and
+        a reply is reused for QUERY_CACHE_TTL. Failures are not kept.
+        """
+        key = (proto, addr[0], int(addr[1]))
+        cached = self.results.get(key)
+        if cached is not None:
+            if time.monotonic() - cached[0] < QUERY_CACHE_TTL:
+                return cached[1]
+            del self.results[key]
+
+        future = self.inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(
+                self.request(addr, proto, timeout, encoding)
+            )
+            self.inflight[key] = future
+            future.add_done_callback(lambda f: self._settle(key, f))
+        # one caller giving up must not cancel the others
+        return await asyncio.shield(future)
+
+    def _settle(self, key: tuple, future: asyncio.Future) -> None:
+        del self.inflight[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        if len(self.results) >= QUERY_CACHE_SIZE:
+            now = time.monotonic()
+            self.results = {
+                k: v
+                for k, v in self.results.items()
+                if now - v[0] < QUERY_CACHE_TTL
+            }
+        self.results[key] = (time.monotonic(), future.result())
+
+    async def info_async(
+        self, addr: tuple[str, int], timeout: float | None = None
+    ) -> a2s.SourceInfo:
+        return await self.fetch(addr, InfoProtocol, timeout)
+
+    async def rules_async(
+        self, addr: tuple[str, int], timeout: float | None = None
+    ) -> dayzquery.DayzRules:
+        res = await self.fetch(addr, RulesProtocol, timeout, None)
+        return dayzquery.dayz_rules_decode(res)
+
+    async def probe_async(
+        self,
+        addr: tuple[str, int],
+        samples: int,
+        spacing: float,
+        timeout: float | None = None,
+    ) -> list[float | None]:
+        """
+        Round trips of spaced info requests; None for lost probes.
+        Lost probes are not retried and do not count against the
+        server's timeout; they count as loss.
+        """
+        rtts = []
+        for sample in range(samples):
+            if sample > 0:
+                await asyncio.sleep(spacing)
+            try:
+                info = await self.request(
+                    addr, InfoProtocol, timeout, retries=0, backoff=False
+                )
+                rtts.append(info.ping)
+            except Exception:
+                rtts.append(None)
+        return rtts
+
+    async def info_many_async(
+        self, addrs: list[tuple[str, int]], timeout: float | None = None
+    ) -> list[a2s.SourceInfo | None]:
+        async def _info(addr: tuple[str, int]) -> a2s.SourceInfo | None:
+            try:
+                return await self.info_async(addr, timeout)
+            except Exception:
+                return None
+
+        return await asyncio.gather(*[_info(addr) for addr in addrs])
+
+    async def snapshot_async(
+        self, addr: tuple[str, int], timeout: float | None = None
+    ) -> tuple[a2s.SourceInfo | None, dayzquery.DayzRules | None]:
+        """INFO and RULES issued together; None for a failed query"""
+        replies = await asyncio.gather(
+            self.info_async(addr, timeout),
+            self.rules_async(addr, timeout),
+            return_exceptions=True,
+        )
+        return tuple(
+            None if isinstance(res, Exception) else res for res in replies
+        )
+
+    def info(
+        self, addr: tuple[str, int], timeout: float | None = None
+    ) -> a2s.SourceInfo:
+        return self.run(self.info_async(addr, timeout))
+
+    def rules(
+        self, addr: tuple[str, int], timeout: float | None = None
+    ) -> dayzquery.DayzRules:
+        return self.run(self.rules_async(addr, timeout))
+
+    def snapshot(
+        self, addr: tuple[str, int], timeout: float | None = None
+    ) -> tuple[a2s.SourceInfo | None, dayzquery.DayzRules | None]:
+        return self.run(self.snapshot_async(addr, timeout))
+
+    def info_many(
+        self, addrs: list[tuple[str, int]], timeout: float | None = None
+    ) -> list[a2s.SourceInfo | None]:
+        if len(addrs) == 0:
+            return []
+        return self.run(self.info_many_async(addrs, timeout))
+
+    def probe_many(
+        self,
+        addrs: list[tuple[str, int]],
+        samples: int,
+        spacing: float,
+        timeout: float | None = None,
+    ) -> list[list[float | None]]:
+        if len(addrs) == 0:
+            return []
+
+        async def _probe_many() -> list[list[float | None]]:
+            return await asyncio.gather(
+                *[
+                    self.probe_async(addr, samples, spacing, timeout)
+                    for addr in addrs
+                ]
+            )
+
+        return self.run(_probe_many())
+
+
+engine = QueryEngine()
+
+
 @dataclass(slots=True, frozen=True)
 class Res:
     status: int
     parsed: bool
-    json: Union[str, None]
+    rows: Union[list, None]
+    count: int = 0
 
 
 @dataclass(slots=True, frozen=True)
-class Ping:
-    addr: str
-    iteration: int
-    ping: int
+class RttStats:
+    """
+    Round trips of one probe series in ms. A server that answered
+    none of the probes is down and reports a ping of 9999.
+    """
+
+    sent: int
+    lost: int
+    min: int
+    median: int
+    jitter: int
+
+    @classmethod
+    def from_samples(cls, samples: list[float | None]) -> "RttStats":
+        rtts = [math.floor(rtt * 1000) for rtt in samples if rtt is not None]
+        lost = len(samples) - len(rtts)
+        if not rtts:
+            return cls(len(samples), lost, 9999, 9999, 0)
+        # mean variation between consecutive replies (RFC 3550)
+        deltas = [abs(b - a) for a, b in zip(rtts, rtts[1:])]
+        jitter = round(statistics.fmean(deltas)) if deltas else 0
+        median = math.floor(statistics.median(rtts))
+        return cls(len(samples), lost, min(rtts), median, jitter)
+
+    @property
+    def loss(self) -> float:
+        return self.lost / self.sent if self.sent else 1.0
+
+    @property
+    def down(self) -> bool:
+        return self.lost == self.sent
+
+    def __str__(self) -> str:
+        if self.down:
+            return f"No reply to {self.sent} probes"
+        return (
+            f"RTT {self.median} ms (min {self.min}, jitter {self.jitter}), "
+            f"{self.loss:.0%} loss"
+        )
 
 
 @dataclass(slots=True, frozen=True)
@@ -233,6 +1580,18 @@ class Prereqs:
     gameport: int
     appid: Union[int, None]
     version: Union[str, None]
+    # workshop ids, None when the modlist could not be fetched
+    mods: Union[list, None] = None
+
+
+@dataclass(slots=True, frozen=True)
+class Snapshot:
+    """
+    INFO and RULES replies of one server, fetched in one parallel
+    round trip; either is None when its query failed
+    """
+    info: Union[a2s.SourceInfo, None]
+    rules: Union[dayzquery.DayzRules, None]
 
 
 @dataclass(slots=True)
@@ -245,50 +1604,48 @@ class Record:
     qport: int
 
 
+def snapshot(ip: str, qport: int) -> Snapshot:
+    return Snapshot(*engine.snapshot((ip, int(qport))))
+
+
 def get_prereqs(ip: str, qport: int) -> Prereqs:
-    try:
-        info = a2s.info((ip, qport))
-    except TimeoutError:
+    """Connection prerequisites, with the modlist fetched alongside"""
+    snap = snapshot(ip, qport)
+    info = snap.info
+    if info is None:
         return Prereqs(False, 0, None, None)
 
     gameport = getattr(info, "port", 0)
     is_password = getattr(info, "password_protected", False)
     appid = getattr(info, "game_id", None)
     version = getattr(info, "version", None)
+    mods = None
+    if snap.rules is not None:
+        mods = [str(mod.workshop_id) for mod in snap.rules.mods]
 
-    return Prereqs(is_password, gameport, appid, version)
+    return Prereqs(is_password, gameport, appid, version, mods)
 
 
 def details(ip: str, qport: int) -> Details:
     default_str = "None provided"
 
-    try:
-        info = a2s.info((ip, qport))
-    except TimeoutError:
-        return Details(None, default_str, False)
-    try:
-        rules = dayzquery.dayz_rules((ip, int(qport)))
-    except TimeoutError:
+    snap = snapshot(ip, qport)
+    info = snap.info
+    rules = snap.rules
+    if info is None or rules is None:
         return Details(None, default_str, False)
 
     try:
-        keywords = info.keywords.split(",")
+        keywords = parse_keywords(info.keywords)
     except AttributeError:
         return Details(None, default_str, False)
 
     battleye = "Disabled"
-    if "battleye" in keywords:
+    if keywords.battleye:
         battleye = "Enabled"
 
-    day_accel = 0.0
-    night_accel = 0.0
-    for keyword in keywords:
-        if "etm" in keyword:
-            day_accel = float(keyword.lstrip("etm"))
-            day_accel = float(f"{day_accel:g}")
-        if "entm" in keywords:
-            night_accel = float(keyword.lstrip("entm"))
-            night_accel = float(f"{night_accel:g}")
+    day_accel = keywords.day_accel
+    night_accel = keywords.night_accel
 
     try:
         password = info.password_protected
@@ -352,36 +1709,413 @@ def details(ip: str, qport: int) -> Details:
     return Details(rows, description, True)
 
 
-def ping(iteration: int, row: list) -> Ping:
-    addr = row[7]
-    qport = row[8]
+async def answer_query(ip: str, qport: str, mode: str) -> str | None:
+    """
+    What query_v2.py prints for one query, without the trailing
+    newline; None when the server did not answer or mode is unknown
+    """
+    addr = (ip, int(qport))
+    try:
+        match mode:
+            case "info":
+                info = await engine.info_async(addr)
+                res = {}
+                res["name"] = info.server_name
+                res["map"] = info.map_name
+                res["gametype"] = info.keywords
+                res["players"] = info.player_count
+                res["max_players"] = info.max_players
+                res["addr"] = ip + ":" + qport
+                res["gameport"] = str(info.port)
+                res["stat"] = "online"
+                res["qport"] = qport
+                res["ping"] = str(math.floor(info.ping * 1000)) + "ms"
+                return json.dumps([res])
+            case "test":
+                info = await engine.info_async(addr)
+                return info.server_name
+            case "rules":
+                rules = await engine.rules_async(addr)
+                return "\n".join(str(mod.workshop_id) for mod in rules.mods)
+            case "names":
+                rules = await engine.rules_async(addr)
+                res = {}
+                res["names"] = [mod.name for mod in rules.mods]
+                res["ids"] = [mod.workshop_id for mod in rules.mods]
+                return json.dumps(res)
+    except Exception:
+        return None
+    return None
 
-    res = None
 
-    if row[9] != 9999:
-        return Ping(addr, iteration, row[9])
+class QueryService:
+    """
+    JSON-lines front end to the shared engine on a Unix socket, so
+    shell helpers can query servers without starting an interpreter
+    each time. Every request line {"ip", "qport", "mode"} gets one
+    reply line echoing it with "ok" and "output" (see answer_query).
+    Requests on one connection run concurrently and are answered
+    as they complete.
+    """
 
-    try:
-        ip = addr.split(":")[0]
-    except IndexError:
-        ping = 9999
+    def __init__(self, path: str):
+        self.path = path
+        self.server = None
 
-    try:
-        res = query_direct(ip, qport, 0.5)
-    except Exception:
-        pass
+    def start(self) -> None:
+        engine.run(self._start())
 
-    if res is None:
-        ping = 9999
-    else:
-        ping = res["ping"]
+    async def _start(self) -> None:
+        # a socket left behind by a crashed session refuses connections
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self.server = await asyncio.start_unix_server(
+            self._serve, path=self.path, limit=QUERY_LINE_LIMIT
+        )
+        os.chmod(self.path, 0o600)
+
+    def stop(self) -> None:
+        if self.server is None:
+            return
+        engine.run(self._stop())
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    async def _stop(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+        self.server = None
+
+    async def _answer(
+        self, line: bytes, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            req = json.loads(line)
+            ip, qport, mode = req["ip"], str(req["qport"]), req["mode"]
+            output = await answer_query(ip, qport, mode)
+        except (ValueError, KeyError, TypeError):
+            req, output = {}, None
+        reply = dict(req) if isinstance(req, dict) else {}
+        reply["ok"] = output is not None
+        reply["output"] = output or ""
+        writer.write(json.dumps(reply).encode() + b"\n")
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                if not line.strip():
+                    continue
+                task = asyncio.ensure_future(self._answer(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            # the client is done sending; answer before hanging up
+            if tasks:
+                await asyncio.wait(tasks)
+            await writer.drain()
+        except (ConnectionError, ValueError):
+            for task in tasks:
+                task.cancel()
+        finally:
+            writer.close()
+
+
+def measure_many(
+    records: list[tuple[str, int]],
+    samples: int = RTT_SAMPLES,
+    spacing: float = RTT_SPACING,
+) -> list[RttStats]:
+    """
+    Multi-sample counterpart of query_many for round trips only;
+    probes to different servers run concurrently
+    """
+    series = engine.probe_many(records, samples, spacing)
+    return [RttStats.from_samples(rtts) for rtts in series]
+
+
+class PingScheduler:
+    """
+    Pings rows in the background, most relevant first, under a
+    rate limit. focus() replaces the pending rows with a new
+    priority order (e.g. whatever is on screen); rows already
+    measured this session are not pinged again. Each row gets
+    samples spaced probes. Results are handed to
+    deliver(results, drained) from the worker thread as
+    (row, RttStats) pairs, drained being True once nothing is
+    pending. Thread-safe.
+    """
+
+    def __init__(
+        self,
+        deliver: typing.Callable[
+            [list[tuple[Server, RttStats]], bool], None
+        ],
+        cache: PingCache | None = None,
+        rate: float = PING_RATE,
+        batch: int = PING_BATCH,
+        samples: int = RTT_SAMPLES,
+    ):
+        self.deliver = deliver
+        self.cache = cache
+        self.rate = rate
+        self.batch = batch
+        self.samples = samples
+        self.pending = []
+        self.done = set()
+        self.jobs = threading.Condition()
+        self.worker = None
+
+    def due(self, row: Server) -> bool:
+        if id(row) in self.done:
+            return False
+        if row.ping == 9999:
+            return True
+        return self.cache is not None and self.cache.needs_refresh(row.addr)
+
+    def focus(self, rows: list[Server]) -> None:
+        """Pings rows in the given order, dropping earlier requests"""
+        with self.jobs:
+            # reversed so the worker can pop from the end
+            self.pending = [row for row in reversed(rows) if self.due(row)]
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._work, daemon=True)
+                self.worker.start()
+            self.jobs.notify()
+
+    def stop(self) -> None:
+        """Drops pending rows and forgets what was measured"""
+        with self.jobs:
+            self.pending = []
+            self.done = set()
+
+    def _take(self) -> list[Server]:
+        with self.jobs:
+            while not self.pending:
+                self.jobs.wait()
+            taken = []
+            while self.pending and len(taken) < self.batch:
+                row = self.pending.pop()
+                if self.due(row):
+                    self.done.add(id(row))
+                    taken.append(row)
+            return taken
+
+    def _work(self) -> None:
+        while True:
+            rows = self._take()
+            if not rows:
+                continue
+            started = time.monotonic()
+            records = [(row.addr.split(":")[0], row.qport) for row in rows]
+            stats = measure_many(records, self.samples)
+            if self.cache is not None:
+                for row, rtt in zip(rows, stats):
+                    if not rtt.down:
+                        self.cache.put(row.addr, rtt.median)
+            with self.jobs:
+                drained = not self.pending
+            self.deliver(list(zip(rows, stats)), drained)
+            # spread the batch over the time the rate allows for it
+            probes = len(rows) * self.samples
+            delay = probes / self.rate - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+
+@dataclass(slots=True, frozen=True)
+class HttpResponse:
+    status: int
+    body: bytes
 
-    return Ping(addr, iteration, ping)
+
+class HttpStream:
+    """
+    Response whose body is read incrementally and decompressed on the
+    fly. The connection goes back to its pool once the body has been
+    consumed in full.
+    """
+
+    def __init__(
+        self,
+        client: "HttpClient",
+        pool: queue.LifoQueue,
+        conn: http.client.HTTPConnection,
+        response: http.client.HTTPResponse,
+    ):
+        self.client = client
+        self.pool = pool
+        self.conn = conn
+        self.response = response
+        self.status = response.status
+
+    def __iter__(self) -> typing.Iterator[bytes]:
+        encoding = self.response.getheader("Content-Encoding")
+        match encoding:
+            case "gzip" | "deflate":
+                # wbits + 32 detects both gzip and zlib headers
+                decomp = zlib.decompressobj(zlib.MAX_WBITS + 32)
+            case _:
+                decomp = None
+
+        try:
+            while True:
+                data = self.response.read(HTTP_CHUNK)
+                if not data:
+                    break
+                if decomp is None:
+                    yield data
+                    continue
+                try:
+                    data = decomp.decompress(data)
+                except zlib.error:
+                    if encoding != "deflate" or decomp.unused_data:
+                        raise
+                    # raw deflate stream without the zlib header
+                    decomp = zlib.decompressobj(-zlib.MAX_WBITS)
+                    data = decomp.decompress(data)
+                if data:
+                    yield data
+            if decomp is not None:
+                tail = decomp.flush()
+                if tail:
+                    yield tail
+        except (OSError, http.client.HTTPException, zlib.error) as e:
+            self.conn.close()
+            raise HttpError(f"Failed to read response body: {e}")
+        self.release()
+
+    def read(self) -> bytes:
+        return b"".join(self)
+
+    def release(self) -> None:
+        if self.response.will_close or not self.response.isclosed():
+            self.conn.close()
+        else:
+            self.client.release(self.pool, self.conn)
+
+    def discard(self) -> None:
+        try:
+            self.response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            return
+        self.release()
+
+
+class HttpClient:
+    """
+    Small HTTP/1.1 client shared by the Steam and Battlemetrics
+    queries. Connections are kept alive and pooled per host, bodies
+    are requested and decoded as gzip/deflate, and transient failures
+    are retried with exponential backoff.
+
+    Thread-safe.
+    """
+
+    def __init__(
+        self,
+        timeout: float = HTTP_TIMEOUT,
+        retries: int = HTTP_RETRIES,
+        backoff: float = HTTP_BACKOFF,
+        pool_size: int = HTTP_POOL_SIZE,
+    ):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.pools: dict[tuple[str, str], queue.LifoQueue] = {}
+        self.lock = threading.Lock()
+
+    def _pool(self, scheme: str, netloc: str) -> queue.LifoQueue:
+        with self.lock:
+            key = (scheme, netloc)
+            if key not in self.pools:
+                self.pools[key] = queue.LifoQueue(self.pool_size)
+            return self.pools[key]
+
+    def _connect(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        if scheme == "http":
+            return http.client.HTTPConnection(netloc, timeout=self.timeout)
+        raise HttpError(f"Unsupported scheme '{scheme}'")
+
+    def _wait(self, attempt: int) -> None:
+        if attempt <= self.retries:
+            time.sleep(self.backoff * 2 ** (attempt - 1))
+
+    def release(
+        self, pool: queue.LifoQueue, conn: http.client.HTTPConnection
+    ) -> None:
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def open(self, url: str, headers: dict | None = None) -> HttpStream:
+        """
+        Retries until response headers arrive with a status that is
+        not transient; the body is left for the caller to stream
+        """
+        target = parse.urlsplit(url)
+        path = target.path or "/"
+        if target.query:
+            path = f"{path}?{target.query}"
+        hdr = {"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"}
+        if headers:
+            hdr.update(headers)
+
+        pool = self._pool(target.scheme, target.netloc)
+        error: Exception | None = None
+        attempt = 0
+        while attempt <= self.retries:
+            try:
+                conn = pool.get_nowait()
+                reused = True
+            except queue.Empty:
+                conn = self._connect(target.scheme, target.netloc)
+                reused = False
+
+            try:
+                conn.request("GET", path, headers=hdr)
+                response = conn.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                error = e
+                # the server may have dropped an idle pooled socket;
+                # that is retried at once on another connection
+                if not reused:
+                    attempt += 1
+                    self._wait(attempt)
+                continue
+
+            stream = HttpStream(self, pool, conn, response)
+            if response.status in HTTP_RETRY_STATUS:
+                stream.discard()
+                error = HttpError(f"HTTP {response.status}")
+                attempt += 1
+                self._wait(attempt)
+                continue
+            return stream
+
+        raise HttpError(f"Request to {target.netloc} failed: {error}")
+
+    def get(self, url: str, headers: dict | None = None) -> HttpResponse:
+        stream = self.open(url, headers)
+        return HttpResponse(stream.status, stream.read())
+
+
+http_client = HttpClient()
 
 
 def query_api(key: str, appid: int, param: str) -> Res:
-    LIMIT = 10000
-    url = "https://api.steampowered.com/IGameServersService/GetServerList/v1/?"
+    url = f"{STEAM_API_URL}/IGameServersService/GetServerList/v1/?"
 
     payload: dict[str, Union[int, str]] = {
         "filter": r"\appid" + fr"\{appid}" + param,
@@ -391,26 +2125,23 @@ def query_api(key: str, appid: int, param: str) -> Res:
     par = parse.urlencode(payload)
     url = f"{url}{par}"
 
-    status = 200
-    parsed = True
-    data = None
+    try:
+        response = http_client.open(url)
+    except HttpError:
+        return Res(0, False, None)
+
+    if response.status != 200:
+        response.discard()
+        return Res(response.status, False, None)
 
+    decoder = ServerListDecoder()
     try:
-        with request.urlopen(url) as response:
-            if response.status != 200:
-                status = response.status
-            try:
-                parsed = True
-                data = json.load(response)
-            except json.decoder.JSONDecodeError:
-                parsed = False
-                data = None
-    except HTTPError:
-        status = 403
-        parsed = False
-        data = None
-    finally:
-        return Res(status, parsed, data)
+        for chunk in response:
+            decoder.feed(chunk)
+        decoder.close()
+    except (HttpError, json.decoder.JSONDecodeError):
+        return Res(response.status, False, None)
+    return Res(response.status, True, decoder.rows, decoder.count)
 
 
 def query_bm_api(api_key: str, bm_id: str) -> Record:
@@ -423,27 +2154,29 @@ def query_bm_api(api_key: str, bm_id: str) -> Record:
         "filter[ids][whitelist]": bm_id,
     }
 
-    url = "https://api.battlemetrics.com/servers?"
+    url = f"{BM_API_URL}/servers?"
     par = parse.urlencode(payload)
     url = f"{url}{par}"
 
     hdr = {"Authorization": "Bearer " + api_key}
-    r = request.Request(url, headers=hdr)
 
     try:
-        with request.urlopen(r) as response:
-            try:
-                j = json.load(response)
-            except json.decoder.JSONDecodeError:
-                raise BmAPIError("Malformed response from Battlemetrics")
-
-            if len(j["data"]) < 1:
-                raise BmAPIError("Not a valid Battlemetrics ID")
-            j = j["data"][0]["attributes"]
-            return Record(j["ip"], j["port"], j["portQuery"])
-    except HTTPError:
+        response = http_client.get(url, hdr)
+    except HttpError:
+        raise BmAPIError("Failed to query Battlemetrics")
+    if response.status != 200:
         raise BmAPIError("Failed to query Battlemetrics")
 
+    try:
+        j = json.loads(response.body)
+    except (json.decoder.JSONDecodeError, UnicodeDecodeError):
+        raise BmAPIError("Malformed response from Battlemetrics")
+
+    if len(j["data"]) < 1:
+        raise BmAPIError("Not a valid Battlemetrics ID")
+    j = j["data"][0]["attributes"]
+    return Record(j["ip"], j["port"], j["portQuery"])
+
 
 def validate_ip(addr: str) -> Record:
     fields = addr.split(":")
@@ -470,3 +2203,96 @@ def validate_ip(addr: str) -> Record:
     qport = int(addr.split(":")[1])
     record = Record(ip, 0, qport)
     return record
+
+
+@dataclass(slots=True, frozen=True)
+class Shard:
+    appid: int
+    param: str
+    size: int
+    res: Res
+
+
+class ShardPlanner:
+    """
+    Runs GetServerList queries for a set of base filters, splitting any
+    filter whose response reaches LIMIT into sub-filters until each
+    request fits under the cap. Shard sizes are persisted so that
+    shards known to be large are split before they are queried.
+    """
+
+    def __init__(self, path: str, workers: int = SHARD_WORKERS):
+        self.path = path
+        self.workers = workers
+        self.planned = 0
+        try:
+            with open(path, "r") as infile:
+                self.sizes = json.load(infile)
+        except (OSError, json.decoder.JSONDecodeError):
+            self.sizes = {}
+        if not isinstance(self.sizes, dict):
+            self.sizes = {}
+
+    def save(self) -> None:
+        try:
+            with open(self.path, "w") as outfile:
+                json.dump(self.sizes, outfile, indent=2)
+        except OSError:
+            pass
+
+    def split(self, param: str) -> list[str]:
+        for predicate in splits:
+            if predicate in param:
+                continue
+            return [param + predicate, param + r"\nor\1" + predicate]
+        return []
+
+    def plan(self, appid: int, param: str) -> list[str]:
+        size = self.sizes.get(f"{appid}{param}", 0)
+        if size < LIMIT * SPLIT_RATIO:
+            return [param]
+        children = self.split(param)
+        if not children:
+            return [param]
+        return [p for child in children for p in self.plan(appid, child)]
+
+    def run(
+        self, key: str, queries: list[tuple[int, str]]
+    ) -> typing.Iterator[Shard]:
+        """
+        Yields shards as they complete. Failed queries are yielded
+        too so that the caller can decide whether to abort.
+        """
+        with ThreadPoolExecutor(self.workers) as executor:
+            pending = {}
+            for appid, base in queries:
+                for param in self.plan(appid, base):
+                    future = executor.submit(query_api, key, appid, param)
+                    pending[future] = (appid, param)
+            self.planned = len(pending)
+
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        appid, param = pending.pop(future)
+                        res = future.result()
+                        size = 0
+                        if res.status == 200 and res.parsed:
+                            size = res.count
+                            self.sizes[f"{appid}{param}"] = size
+
+                        children = []
+                        if size >= LIMIT:
+                            children = self.split(param)
+                        if children:
+                            for child in children:
+                                job = executor.submit(
+                                    query_api, key, appid, child
+                                )
+                                pending[job] = (appid, child)
+                            self.planned += len(children) - 1
+                            continue
+                        yield Shard(appid, param, size, res)
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
@@ -1,3 +1,4 @@
+import bisect
 import csv
 import json
 import locale
@@ -15,9 +16,9 @@ import warnings
 
 from dataclasses import dataclass
 from enum import Enum
+from array import array
+from collections import OrderedDict
 from collections.abc import Callable
-from concurrent.futures import wait
-from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Literal, Self, Any, TYPE_CHECKING
 
@@ -51,6 +52,14 @@ delimiter = "␞"
 
 APPID_DAYZ = 221100
 APPID_DAYZ_EXP = 1024020
+BROWSER_CACHE_MAX_AGE = 24 * 60 * 60
+KEYWORD_DEBOUNCE_MS = 250
+FILTER_CACHE_BUDGET = 32 * 1024 * 1024
+MAX_SORT_KEYS = 3
+RANGE_MAX = 2**31 - 1
+# rows on either side of the viewport pinged ahead of scrolling
+PING_LOOKAHEAD = 100
+PING_SCROLL_DEBOUNCE_MS = 150
 
 cache: dict[str, int] = {}
 config_vals: list[str] = []
@@ -78,6 +87,10 @@ funcs = f"{helpers_path}/funcs"
 mods_temp_file = f"{cache_path}/{app_name_abbr}.mods_temp"
 stale_mods_temp_file = f"{cache_path}/{app_name_abbr}.stale_mods_temp"
 servers_path = f"{cache_path}/{app_name_abbr}.servers"
+shards_path = f"{cache_path}/{app_name_abbr}.shards.json"
+pings_path = f"{cache_path}/{app_name_abbr}.pings.json"
+rtt_path = f"{cache_path}/{app_name_abbr}.rtt.json"
+query_socket = f"{cache_path}/{app_name_abbr}.query.sock"
 config_path = f"{user_path}/.config/dztui"
 config_file = f"{config_path}/dztuirc"
 history_file = f"{state_path}/{app_name_abbr}.history"
@@ -171,6 +184,7 @@ class FilterMode(Enum):
     INITIAL = 3
     TOGGLE_OFF = 4
     TOGGLE_ON = 5
+    RANGE = 6
 
 
 class EnumWithAttrs(Enum):
@@ -689,7 +703,17 @@ def write_json(data: str, path: str) -> None:
         raise e
 
 
+def save_query_state() -> None:
+    """Persists ping results and per-server RTT history"""
+    for store in ModelManager.ping_cache, Servers.engine.rtt:
+        try:
+            store.save()
+        except Servers.CacheError as e:
+            logger.warning(e)
+
+
 def save_res_and_quit(*args) -> None:
+    save_query_state()
     if App.window.props.is_maximized:
         Gtk.main_quit()
         return
@@ -1071,9 +1095,9 @@ def prepare_connection(rowtype: RowType, record: Record) -> None:
             if msg != "":
                 res = spawn_dialog(msg, Popup.CONFIRM)
                 if res is False:
-                    try_connect(addr, str(prereqs.appid), str(pefile_path), rowtype)
+                    try_connect(addr, str(prereqs.appid), str(pefile_path), rowtype, prereqs.mods)
             else:
-                try_connect(addr, str(prereqs.appid), str(pefile_path), rowtype)
+                try_connect(addr, str(prereqs.appid), str(pefile_path), rowtype, prereqs.mods)
 
         proceed, msg, pefile_path, prereqs = App.treeview.get_prereqs(record)
         GLib.idle_add(cleanup)
@@ -1087,15 +1111,20 @@ def try_connect(
     addr: str,
     appid: str,
     path: str,
-    row: RowType
+    row: RowType,
+    mods: list | None = None
 ) -> None:
     def background(addr, appid, path):
         def cleanup():
             App.treeview.dialog_hide()
             parse_shell_output(proc, row)
 
+        # a modlist fetched with the prerequisites spares another query
+        args = [addr, appid, path]
+        if mods is not None:
+            args.append("\n".join(mods))
         try:
-            proc = call_out("try_connect", addr, appid, path)
+            proc = call_out("try_connect", *args)
         except Exception as e:
             logger.critical(e)
             GLib.idle_add(cleanup)
@@ -1348,6 +1377,21 @@ class ScrollableTree(Gtk.ScrolledWindow):
 
         self.treeview = TreeView()
         self.add(self.treeview)
+        self.scroll_timer = None
+        self.get_vadjustment().connect("value-changed", self._on_scrolled)
+
+    def _on_scrolled(self, adjustment: Gtk.Adjustment) -> None:
+        """Re-aims background pinging once scrolling settles"""
+        if not ModelManager.pinging or self.scroll_timer is not None:
+            return
+        self.scroll_timer = GLib.timeout_add(
+            PING_SCROLL_DEBOUNCE_MS, self._on_scroll_timeout
+        )
+
+    def _on_scroll_timeout(self) -> Literal[False]:
+        self.scroll_timer = None
+        ModelManager.ping_viewport()
+        return False
 
 
 class RightPanel(Gtk.Box):
@@ -1365,8 +1409,8 @@ class RightPanel(Gtk.Box):
             "actually connecting to a server"
         )
         ping_tooltip = (
-            "Refresh the ping for visible servers.\n"
-            "Available once per unique filter context"
+            "Ping visible servers, then the rest\n"
+            "as they scroll into view"
         )
 
         self.ping = Gtk.Button(
@@ -1412,6 +1456,9 @@ class RightPanel(Gtk.Box):
         self.selected = "All maps"
         self.filters_vbox.set_unique_maps(rows)
 
+    def extend_maps(self, rows: list) -> None:
+        self.filters_vbox.add_unique_maps(rows)
+
     def toggle_debug(self) -> None:
         if type(App.window.get_focus()) is Gtk.Entry:
             return
@@ -1425,35 +1472,11 @@ class RightPanel(Gtk.Box):
         App.grid.notebook.focus_current()
 
     def _on_ping_clicked(self, button: Gtk.Button) -> None:
-        block_signals()
-
-        def _update_pings():
-            rows = ModelManager.get_filtered()
-            with ThreadPoolExecutor(100) as executor:
-                futures = [
-                    executor.submit(Servers.ping, i, row)
-                    for i, row in enumerate(rows)
-                ]
-                wait(futures)
-                for future in futures:
-                    res = future.result()
-                    path = Gtk.TreePath.new_from_indices([res.iteration])
-                    temp_model[path][9] = res.ping
-                    ModelManager.ping_cache[res.addr] = res.ping
-            App.treeview.set_model(temp_model)
-            App.treeview.wait_dialog.destroy()
-            App.treeview.enable_ping_column(True)
-            App.treeview.grab_focus()
-            App.right_panel.ping.set_sensitive(False)
-
-            unblock_signals()
-
-        temp_model = App.treeview.get_model()
-        App.treeview.set_model(None)
-        App.treeview.wait_dialog = GenericDialog("Pinging servers", Popup.WAIT)
-        App.treeview.wait_dialog.show_all()
-        thread = threading.Thread(target=_update_pings, args=())
-        thread.start()
+        # pings stream into the visible rows; scrolling re-aims them
+        App.treeview.enable_ping_column(True)
+        App.right_panel.ping.set_sensitive(False)
+        ModelManager.start_pinging()
+        App.treeview.grab_focus()
 
     def _on_question_clicked(self, button: Gtk.Button) -> None:
         App.grid.notebook.toggle_keybindings()
@@ -1563,213 +1586,691 @@ class CalcDist(multiprocessing.Process):
         self.result_queue.put([self.addr, km])
 
 
-class ModelManagerSingleton:
+class FilterCache:
+    """
+    LRU of filter results keyed by FilterPanel.get_filters() tuples.
+    Entries hold an index array and the list of filtered rows; the
+    rows themselves are shared with the control model and are not
+    counted against the budget.
+    """
+
+    def __init__(self, budget: int = FILTER_CACHE_BUDGET):
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, filters: tuple) -> tuple | None:
+        entry = self.entries.get(filters)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(filters)
+        return entry[:2]
+
+    def put(self, filters: tuple, index: list, rows: list) -> None:
+        index = array("I", index)
+        size = sys.getsizeof(index) + sys.getsizeof(rows)
+        self.discard(filters)
+        if size > self.budget:
+            return
+        self.entries[filters] = (index, rows, size)
+        self.size += size
+        while self.size > self.budget:
+            _, (_, _, evicted) = self.entries.popitem(last=False)
+            self.size -= evicted
+            self.evictions += 1
+
+    def items(self) -> list[tuple[tuple, array, list]]:
+        """Entries as (filters, index, rows), least recently used first"""
+        return [(k, v[0], v[1]) for k, v in self.entries.items()]
+
+    def replace(self, filters: tuple, index: list, rows: list) -> None:
+        """Swaps an entry's contents without touching its recency"""
+        if filters not in self.entries:
+            return
+        index = array("I", index)
+        size = sys.getsizeof(index) + sys.getsizeof(rows)
+        self.size += size - self.entries[filters][2]
+        self.entries[filters] = (index, rows, size)
+
+    def discard(self, filters: tuple) -> None:
+        entry = self.entries.pop(filters, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self) -> str:
+        return (
+            f"{len(self.entries)} entries, {self.size / 1024**2:.1f} MiB, "
+            f"{self.hits} hits, {self.misses} misses, "
+            f"{self.evictions} evictions"
+        )
+
+
+class ServerModel(GObject.Object, Gtk.TreeModel, Gtk.TreeSortable):
     """
-    Manages access to ListStore cache resources and
-    performs filtering on behalf of TreeView.
+    Lazy list model over a shared list of Servers.Server rows. The
+    visible rows are an index array into that list, so a filter pass
+    only swaps the array instead of copying rows into a ListStore.
 
-    Filtration to and from ListStore format is
-    delegated to this singleston.
+    Swap the index with set_index() while the model is detached from
+    its view; row-level edits (append/remove/set_value) emit signals
+    and are safe while attached.
 
-    Not thread-safe.
+    Clicking column headers stacks up to MAX_SORT_KEYS sort keys,
+    the latest click being the primary key.
     """
 
+    types = (str, str, str, str, int, int, int, str, int, int, str, bool)
+    fields = Servers.Server.__slots__[: len(types)]
+
     def __init__(self):
-        # packed ListStores
-        self.filter_cache = {}
-        self.ping_cache = {}
+        super().__init__()
+        # streaming models own their rows and have no table
+        self.table = None
+        self.rows = []
+        self.index = []
+        self.stamp = 0
+        self.reset_sort()
+
+    def reset_sort(self) -> None:
+        self.sort_id = Gtk.TREE_SORTABLE_UNSORTED_SORT_COLUMN_ID
+        self.sort_order = Gtk.SortType.ASCENDING
+        # (field, descending) pairs, primary key first
+        self.sort_spec = []
+
+    def set_index(self, table: "Servers.ServerTable", index: list) -> None:
+        """Shows table.rows[i] for each i in index, in the sort order"""
+        self.table = table
+        self.rows = table.rows
+        self.index = self.sorted(index)
+        self.stamp += 1
+
+    def rebase(self, table: "Servers.ServerTable") -> None:
+        """
+        Re-points the visible rows into a replacement table, e.g.
+        after rows were added to or dropped from the control model.
+        Visible rows missing from the new table are removed.
+        """
+        positions = {id(row): i for i, row in enumerate(table.rows)}
+        for pos in reversed(range(len(self.index))):
+            if id(self.rows[self.index[pos]]) not in positions:
+                del self.index[pos]
+                self.row_deleted(Gtk.TreePath.new_from_indices([pos]))
+        self.index = [positions[id(self.rows[i])] for i in self.index]
+        self.table = table
+        self.rows = table.rows
+
+    def get_rows(self) -> list:
+        rows = self.rows
+        return [rows[i] for i in self.index]
+
+    def sorted(self, index: list) -> list:
+        if not self.sort_spec:
+            return list(index)
+        table = self.table
+        if table is None:
+            table = Servers.ServerTable(self.rows, searchable=False)
+        return table.sort(index, self.sort_spec)
+
+    def _iter(self, pos: int) -> Gtk.TreeIter:
+        it = Gtk.TreeIter()
+        it.stamp = self.stamp
+        it.user_data = pos
+        return it
+
+    def get_row(self, it: Gtk.TreeIter) -> "Servers.Server":
+        return self.rows[self.index[it.user_data]]
+
+    def append(self, row: "Servers.Server") -> Gtk.TreeIter:
+        self.rows.append(row)
+        self.index.append(len(self.rows) - 1)
+        pos = len(self.index) - 1
+        it = self._iter(pos)
+        self.row_inserted(Gtk.TreePath.new_from_indices([pos]), it)
+        return it
+
+    def insert(self, pos: int, i: int) -> None:
+        """Shows rows[i] at position pos"""
+        self.index.insert(pos, i)
+        self.row_inserted(
+            Gtk.TreePath.new_from_indices([pos]), self._iter(pos)
+        )
+
+    def remove(self, it: Gtk.TreeIter) -> bool:
+        """Hides the row from this view; the shared rows are untouched"""
+        pos = it.user_data
+        del self.index[pos]
+        self.row_deleted(Gtk.TreePath.new_from_indices([pos]))
+        return pos < len(self.index)
+
+    def clear(self) -> None:
+        while self.index:
+            self.index.pop()
+            path = Gtk.TreePath.new_from_indices([len(self.index)])
+            self.row_deleted(path)
+
+    def set_value(self, it: Gtk.TreeIter, column: int, value: Any) -> None:
+        field = self.fields[column]
+        setattr(self.get_row(it), field, value)
+        self.row_changed(Gtk.TreePath.new_from_indices([it.user_data]), it)
+        # pings arrive in bulk and are re-indexed once per batch
+        if self.table is not None and field in ("players", "queue"):
+            i = self.index[it.user_data]
+            ModelManager.update_row(self.table, i, field)
+
+    def discard(self, table: "Servers.ServerTable", i: int) -> bool:
+        """Removes table row i from the view if it is still shown"""
+        if table is not self.table or i not in self.index:
+            return False
+        self.remove(self.iter_nth_child(None, self.index.index(i)))
+        return False
+
+    def changed(self, pos: int) -> None:
+        self.row_changed(
+            Gtk.TreePath.new_from_indices([pos]), self._iter(pos)
+        )
+
+    def do_get_flags(self) -> Gtk.TreeModelFlags:
+        return Gtk.TreeModelFlags.LIST_ONLY
+
+    def do_get_n_columns(self) -> int:
+        return len(self.types)
+
+    def do_get_column_type(self, column: int) -> type:
+        return self.types[column]
+
+    def do_get_iter(self, path: Gtk.TreePath) -> tuple:
+        pos = path.get_indices()[0]
+        if pos >= len(self.index):
+            return (False, None)
+        return (True, self._iter(pos))
+
+    def do_get_path(self, it: Gtk.TreeIter) -> Gtk.TreePath:
+        return Gtk.TreePath.new_from_indices([it.user_data])
+
+    def do_get_value(self, it: Gtk.TreeIter, column: int) -> Any:
+        return getattr(self.get_row(it), self.fields[column])
+
+    def do_iter_next(self, it: Gtk.TreeIter) -> bool:
+        pos = it.user_data + 1
+        if pos >= len(self.index):
+            return False
+        it.user_data = pos
+        return True
+
+    def do_iter_previous(self, it: Gtk.TreeIter) -> bool:
+        pos = it.user_data - 1
+        if pos < 0:
+            return False
+        it.user_data = pos
+        return True
+
+    def do_iter_children(self, parent: Gtk.TreeIter | None) -> tuple:
+        if parent is not None or not self.index:
+            return (False, None)
+        return (True, self._iter(0))
+
+    def do_iter_has_child(self, it: Gtk.TreeIter) -> bool:
+        return False
+
+    def do_iter_n_children(self, it: Gtk.TreeIter | None) -> int:
+        if it is not None:
+            return 0
+        return len(self.index)
+
+    def do_iter_nth_child(
+        self, parent: Gtk.TreeIter | None, n: int
+    ) -> tuple:
+        if parent is not None or n >= len(self.index):
+            return (False, None)
+        return (True, self._iter(n))
+
+    def do_iter_parent(self, child: Gtk.TreeIter) -> tuple:
+        return (False, None)
+
+    def do_get_sort_column_id(self) -> tuple:
+        return (self.sort_id >= 0, self.sort_id, self.sort_order)
+
+    def do_set_sort_column_id(
+        self, sort_id: int, order: Gtk.SortType
+    ) -> None:
+        if sort_id == self.sort_id and order == self.sort_order:
+            return
+        if sort_id < 0:
+            self.reset_sort()
+        else:
+            field = self.fields[sort_id]
+            descending = order == Gtk.SortType.DESCENDING
+            prior = [k for k in self.sort_spec if k[0] != field]
+            self.sort_spec = [(field, descending)] + prior
+            del self.sort_spec[MAX_SORT_KEYS:]
+        self.sort_id = sort_id
+        self.sort_order = order
+        self.sort_column_changed()
+        if sort_id < 0 or not self.index:
+            return
+
+        # new_order[new position] = old position
+        positions = {i: pos for pos, i in enumerate(self.index)}
+        self.index = self.sorted(self.index)
+        self.stamp += 1
+        new_order = [positions[i] for i in self.index]
+        self.rows_reordered(Gtk.TreePath(), None, new_order)
+        # different rows are on screen now
+        ModelManager.ping_viewport()
+
+    def do_set_sort_func(self, sort_id, sort_func, *user_data) -> None:
+        pass
+
+    def do_set_default_sort_func(self, sort_func, *user_data) -> None:
+        pass
+
+    def do_has_default_sort_func(self) -> bool:
+        return False
+
+
+class ModelManagerSingleton:
+    """
+    Manages access to the shared ServerModel and its
+    cached filter indexes and performs filtering on
+    behalf of TreeView.
+
+    Filter passes run on a single worker thread. Each
+    request is tagged with a generation; a newer request
+    supersedes pending work and stale results never
+    reach the view.
+    """
+
+    def __init__(self):
+        # filter tuple -> (index into table.rows, filtered rows)
+        self.filter_cache = FilterCache()
+        # ip:gameport -> last ping, persisted across sessions
+        self.ping_cache = Servers.PingCache(pings_path)
+        # background pings, aimed at the viewport once started
+        self.pinger = Servers.PingScheduler(self._on_pings, self.ping_cache)
+        self.pinging = False
         # stringwise (list) representation of the model
         self.control_model = None
+        # column-wise view of control_model with filter bitsets
+        self.table = None
+        # lazy TreeModel shared by every filter combination
+        self.model = ServerModel()
         self.filtered = None
+        self.store = None
         self.success = True
+        # serializes filter passes against background merges
+        self.lock = threading.Lock()
+        # latest filter request, picked up by the worker thread
+        self.jobs = threading.Condition()
+        self.job = None
+        self.generation = 0
+        self.worker = None
+        # set when a pass raised, cleared by the next one
+        self.worker_failed = False
 
     def __new__(cls):
         if not hasattr(cls, "instance"):
             cls.instance = super(ModelManagerSingleton, cls).__new__(cls)
         return cls.instance
 
-    def filter(self, mode: FilterMode, *args, **kwargs) -> None:
+    def submit(self, mode: FilterMode, *args) -> None:
+        """Queues a filter pass, replacing any request not yet started"""
+        with self.jobs:
+            self.generation += 1
+            self.job = (self.generation, mode, args)
+            self.jobs.notify()
+            if self.worker is None:
+                self.worker = threading.Thread(
+                    target=self._work, daemon=True
+                )
+                self.worker.start()
+
+    def _work(self) -> None:
+        while True:
+            with self.jobs:
+                while self.job is None:
+                    self.jobs.wait()
+                generation, mode, args = self.job
+                self.job = None
+            if self.worker_failed:
+                self.worker_failed = False
+                self.set_success(True)
+            try:
+                self.filter(mode, *args, generation=generation)
+            except Exception as e:
+                # the worker outlives a failed pass; report it as one
+                logger.warning(f"Filter pass failed: {e}")
+                self.worker_failed = True
+                self.set_success(False)
+                self.set_store(None)
+                GLib.idle_add(self._deliver, generation)
+
+    def is_stale(self, generation: int) -> bool:
+        return generation != self.generation
+
+    def filter(
+        self, mode: FilterMode, *args, generation: int | None = None
+    ) -> None:
         """
         Native Gtk.TreeView.refilter() method was not performant enough
         when running in the main loop with 40k+ records
         """
+        if generation is None:
+            # direct callers also supersede anything in flight
+            with self.jobs:
+                self.generation += 1
+                self.job = None
+                generation = self.generation
+        with self.lock:
+            self._filter(mode, generation, *args)
+
+    def _deliver(self, generation: int) -> bool:
+        if not self.is_stale(generation):
+            App.treeview._filter_cleanup()
+        return False
+
+    def _filter(self, mode: FilterMode, generation: int, *args) -> None:
+        if self.is_stale(generation):
+            return
         filters = App.right_panel.filters_vbox.get_filters()
+        self.sync_distances(filters)
 
-        if filters in self.filter_cache:
-            cache = self.filter_cache[filters]
-            self.set_store(cache[0])
-            self.set_filtered(cache[1])
-            GLib.idle_add(App.treeview._filter_cleanup)
+        cached = self.filter_cache.get(filters)
+        if cached is not None:
+            self.show(*cached)
+            GLib.idle_add(self._deliver, generation)
             return
 
         match mode:
             case FilterMode.INITIAL:
-                rows = self.filter_initial(filters)
+                index = self.filter_initial(filters)
 
             case FilterMode.MAP:
                 panel = App.right_panel.filters_vbox
                 prior_map = panel.get_prior_map()
 
-                if prior_map == "All maps":
-                    rows = self.filter_map(filters)
-                else:
-                    App.right_panel.ping.set_sensitive(True)
-                    rows = self.filter_toggle_on(filters, *args)
+                if prior_map != "All maps":
+                    App.right_panel.ping.set_sensitive(not self.pinging)
+                index = self.filter_toggle_on(filters, *args)
 
-            case FilterMode.KEYWORD:
-                App.right_panel.ping.set_sensitive(True)
-                rows = self.filter_toggle_on(filters, *args)
+            case (
+                FilterMode.KEYWORD | FilterMode.TOGGLE_ON | FilterMode.RANGE
+            ):
+                App.right_panel.ping.set_sensitive(not self.pinging)
+                index = self.filter_toggle_on(filters, *args)
 
             case FilterMode.TOGGLE_OFF:
-                for f in filters[2:]:
-                    self.set_filtered(self.filter_toggle_off(filters, f))
-                rows = self.filtered
-
-            case FilterMode.TOGGLE_ON:
-                App.right_panel.ping.set_sensitive(True)
-                rows = self.filter_toggle_on(filters, *args)
-
-        if mode is not FilterMode.INITIAL:
-            for row in rows:
-                if row[7] in self.ping_cache:
-                    row[9] = self.ping_cache[row[7]]
-
-        if len(rows) > 0:
-            clone = ModelManager.new_model()
-            rows = self.sort_rows(rows)
-            for row in rows:
-                clone.append(row)
-        else:
-            clone = None
+                index = self.filter_toggle_on(filters, *args)
 
-        self.set_cache(filters, clone, rows)
-        self.set_store(clone)
-        GLib.idle_add(App.treeview._filter_cleanup)
+        if self.is_stale(generation):
+            return
+        rows = [self.table.rows[i] for i in index]
+        self.set_cache(filters, index, rows)
+        self.show(index, rows)
+        GLib.idle_add(self._deliver, generation)
+
+    def sync_distances(self, filters: tuple) -> None:
+        """Refreshes the distance column when a distance range is set"""
+        ranges = [f[0] for f in filters if isinstance(f, tuple)]
+        if "distance" not in ranges:
+            return
+        if self.table.distances_from == len(cache):
+            return
+        self.table.set_distances(cache)
+        self.filter_cache.clear()
 
-    def sort_rows(self, rows: list) -> list:
-        rows.sort(key=lambda x: re.sub(r"[^A-Za-z0-9]+", "", x[0].lower()))
-        return rows
+    def invalidate_pings(self) -> None:
+        """Re-indexes pings after a batch and refreshes dependent views"""
+        with self.lock:
+            if self.table is None:
+                return
+            self.table.invalidate("ping")
+            for filters, _, _ in self.filter_cache.items():
+                if self.depends(filters, "ping"):
+                    self.filter_cache.replace(filters, *self.resolve(filters))
+
+    def start_pinging(self) -> None:
+        self.pinging = True
+        self.ping_viewport()
+
+    def stop_pinging(self) -> None:
+        self.pinging = False
+        self.pinger.stop()
+
+    def ping_viewport(self) -> None:
+        """Queues the rows on screen first, then the rows around them"""
+        model = self.model
+        if not self.pinging or App.treeview.get_model() is not model:
+            return
+        size = len(model.index)
+        if size == 0:
+            return
+        first, last = App.treeview.get_visible_positions()
+        order = list(range(first, last + 1))
+        for step in range(1, PING_LOOKAHEAD + 1):
+            if last + step < size:
+                order.append(last + step)
+            if first - step >= 0:
+                order.append(first - step)
+        rows, index = model.rows, model.index
+        self.pinger.focus([rows[index[pos]] for pos in order])
+
+    def _on_pings(self, results: list, drained: bool) -> None:
+        GLib.idle_add(self._apply_pings, results, drained)
+
+    def _apply_pings(self, results: list, drained: bool) -> bool:
+        # the ping column, and so sorting, follows the median
+        for row, rtt in results:
+            row.ping = rtt.median
+            row.rtt = rtt
+        self.invalidate_pings()
+
+        model = self.model
+        if App.treeview.get_model() is model and model.index:
+            pinged = {id(row) for row, _ in results}
+            first, last = App.treeview.get_visible_positions()
+            for pos in range(first, last + 1):
+                if id(model.rows[model.index[pos]]) in pinged:
+                    model.changed(pos)
+
+        if drained:
+            save_query_state()
+        return False
 
-    def filter_initial(self, filters: tuple) -> list:
+    def depends(self, filters: tuple, field: str) -> bool:
+        """Whether a filter tuple's result can change with Server.<field>"""
+        labels = {"players": ("Empty", "Full", "Low pop")}.get(field, ())
+        survivor = {"ping": "ping", "players": "population"}.get(field)
+        for f in filters[2:]:
+            if isinstance(f, str) and f in labels:
+                return True
+            if isinstance(f, tuple) and f[0] == field:
+                return True
+            if isinstance(f, Servers.DedupSpec) and f.survivor == survivor:
+                return True
+        return False
+
+    def resolve(self, filters: tuple) -> tuple[list, list]:
+        index = self.filter_toggle_on(filters)
+        rows = self.table.rows
+        return index, [rows[i] for i in index]
+
+    def update_row(
+        self, table: "Servers.ServerTable", i: int, field: str
+    ) -> None:
         """
-        Simply culls the control model of any disabled filters
+        Applies an in-place change to one row of the table to every
+        cached view, re-evaluating only that row where possible
         """
-        self.set_filtered(self.control_model)
-        for f in filters[2:]:
-            self.set_filtered(self.filter_toggle_off(filters, f))
-        return self.filtered
+        with self.lock:
+            if table is not self.table:
+                return
+            table.update(i, field)
+            name = table.key("name")
+            for filters, index, rows in self.filter_cache.items():
+                if not self.depends(filters, field):
+                    continue
+                if "Duplicate" in filters:
+                    self.filter_cache.replace(filters, *self.resolve(filters))
+                    continue
+                shown = i in index
+                if table.passes(i, filters) == shown:
+                    continue
+                if shown:
+                    pos = index.index(i)
+                    del index[pos]
+                    del rows[pos]
+                else:
+                    pos = bisect.bisect_right(index, name(i), key=name)
+                    index.insert(pos, i)
+                    rows.insert(pos, table.rows[i])
+
+    def show(self, index: list, rows: list) -> None:
+        """Swaps the index of the (detached) shared model"""
+        self.set_filtered(rows)
+        if len(index) == 0:
+            self.set_store(None)
+            return
+        self.model.set_index(self.table, index)
+        self.set_store(self.model)
 
-    def filter_map(self, filters: tuple) -> list:
+    def merge(self, control: list, rows: list) -> None:
         """
-        Multi-filtration for any context starts by narrowing by map
+        Applies a refreshed server list to the control model in place.
+        The visible store is patched with the differences rather than
+        rebuilt; other cached filter views are dropped.
         """
-        rows = self.filtered
-        panel = App.right_panel.filters_vbox
-        sel_map = panel.get_selected_map()
+        with self.lock:
+            if self.control_model is not control:
+                # user left the table while the refresh was in flight
+                return
+            fresh = {(row.addr, row.qport): row for row in rows}
+            changed = set()
+            kept = []
+            for row in self.table.live_rows():
+                key = (row.addr, row.qport)
+                new = fresh.pop(key, None)
+                if new is None:
+                    continue
+                new.ping = row.ping
+                new.rtt = row.rtt
+                if new != row:
+                    row.update(new)
+                    changed.add(key)
+                kept.append(row)
+            self.ping_cache.merge(fresh.values())
+            kept += fresh.values()
+            # the visible model still reads the old list until patched
+            self.control_model = kept
+            self.table = Servers.ServerTable(kept)
+
+            self.filter_cache.clear()
+            filters = App.right_panel.filters_vbox.get_filters()
+            index = self.filter_toggle_on(filters)
+            rows = [kept[i] for i in index]
+            self.set_cache(filters, index, rows)
+            self.set_filtered(rows)
 
-        if sel_map == "All maps":
-            return rows
+        logger.info(
+            f"Merged refreshed server list: {len(changed)} changed, "
+            f"{len(fresh)} added"
+        )
+        GLib.idle_add(self._patch_store, kept, index, changed)
 
-        rows = [row for row in rows if row[1] == sel_map]
-        return rows
+    def _patch_store(self, rows: list, index: list, changed: set) -> bool:
+        store = self.model
+        # a filter pass or another refresh has since replaced the view
+        if App.treeview.get_model() is not store:
+            return False
+        if self.table is None or self.table.rows is not rows:
+            return False
 
-    def filter_keyword(self, filters: tuple) -> list:
-        keyword = App.right_panel.filters_vbox.get_keyword_filter()
-        rows = self.filtered
+        store.rebase(self.table)
+        visible = set(index)
+        for pos in reversed(range(len(store.index))):
+            if store.index[pos] not in visible:
+                store.remove(store.iter_nth_child(None, pos))
+        for pos, i in enumerate(store.index):
+            if (rows[i].addr, rows[i].qport) in changed:
+                store.changed(pos)
+
+        present = set(store.index)
+        for pos, i in enumerate(index):
+            if i not in present:
+                store.insert(pos, i)
+        App.grid.statusbar.update_server_meta()
+        return False
 
-        if keyword == "":
-            return rows
+    def preview(self, rows: list) -> list:
+        """
+        Applies the checkbox filters to a partial result set while
+        the server list is still streaming in. Duplicates are only
+        culled within the partial set until the full pass runs.
+        """
+        filters = App.right_panel.filters_vbox.get_filters()
+        table = Servers.ServerTable(rows, searchable=False)
+        self.set_filtered(table.select(filters, narrow=False))
+        return self.filtered
 
-        filtered = [
-            row
-            for row in rows
-            if keyword in row[0].lower()
-            or keyword in row[1].lower()
-            or keyword in row[7].lower()
-        ]
-        return filtered
+    def sort_index(self, index: list) -> list:
+        return self.table.sort(index, [("name", False)])
 
-    def filter_toggle_off(self, filters: tuple, filter_type: str) -> list:
+    def filter_initial(self, filters: tuple) -> list:
         """
-        Sub-filtration of the current model
+        Simply culls the control model of any disabled filters
         """
-        pairs = {"3PP": "1PP", "Day": "Night", "Official": "Unoffic."}
-        for k, v in pairs.items():
-            if k in filters and v in filters:
-                self.set_filtered(None)
-                return []
-
-        rows = self.filtered
-        match filter_type:
-            case "3PP":
-                rows = [row for row in rows if row[2] != "3PP"]
-            case "1PP":
-                rows = [row for row in rows if row[2] != "1PP"]
-            case "Official":
-                rows = [row for row in rows if row[10] != "Official"]
-            case "Unoffic.":
-                rows = [row for row in rows if row[10] != "Unoffic."]
-            case "Empty":
-                rows = [row for row in rows if row[4] != 0]
-            case "Full":
-                rows = [row for row in rows if row[4] != row[5]]
-            case "Duplicate":
-                seen = []
-                final = []
-                for row in rows:
-                    if row[0] in seen:
-                        continue
-                    seen.append(row[0])
-                    final.append(row)
-                rows = final
-            case "Day":
-                reg = r"([0][0-9]|[1][0-6])"
-                rows = [row for row in rows if not re.match(reg, row[3])]
-            case "Night":
-                reg = r"([0][0-4]|[1][8]|[2][0-3])"
-                rows = [row for row in rows if not re.match(reg, row[3])]
-            case "Non-ASCII":
-                rows = [row for row in rows if row[0].isascii()]
-            case "Low pop":
-                rows = [row for row in rows if (row[4] / row[5] * 100) > 30]
-            case "Modded":
-                rows = [row for row in rows if not row[11]]
-        return rows
+        return self.sort_index(self.table.indices(filters, narrow=False))
 
     def filter_toggle_on(self, filters: tuple, *args: str) -> list:
         """Effectively applies all filters"""
-        self.set_filtered(self.control_model)
-        self.set_filtered(self.filter_map(filters))
-        self.set_filtered(self.filter_keyword(filters))
+        return self.sort_index(self.table.indices(filters))
 
-        for f in filters[2:]:
-            self.set_filtered(self.filter_toggle_off(filters, f))
-        return self.filtered
+    def set_cache(self, filters: tuple, index: list, rows: list) -> None:
+        self.filter_cache.put(filters, index, rows)
 
-    def set_cache(
-        self, filters: tuple, model: Gtk.ListStore | None, rows: list
-    ) -> None:
-        self.filter_cache[filters] = (model, rows)
-
-    def new_model(self) -> Gtk.ListStore:
-        return Gtk.ListStore(
-            str, str, str, str, int, int, int, str, int, int, str, bool
-        )
+    def new_model(self) -> ServerModel:
+        return ServerModel()
 
     def resync_model(self, addr: str, qport: int) -> None:
         """Handle in-situ updates to model during
-        row deletion actions. Skipped for ephemeral
-        actions like player count/ping updates
+        row deletion actions. The row is tombstoned in the
+        table and dropped from every cached view in place.
         """
-        for row in self.control_model:
-            if row[7] == addr and row[8] == qport:
-                self.control_model.remove(row)
-
-        self.wipe_cache()
-        filters = App.right_panel.filters_vbox.get_filters()
-        refiltered = self.filter_toggle_on(filters)
-        self.set_filtered(refiltered)
-        self.set_success(True)
+        with self.lock:
+            table = self.table
+            i = table.find(addr, qport)
+            if i is not None:
+                table.remove(i)
+                for filters, index, rows in self.filter_cache.items():
+                    # another duplicate may now survive in its place
+                    if "Duplicate" in filters:
+                        self.filter_cache.replace(
+                            filters, *self.resolve(filters)
+                        )
+                    elif i in index:
+                        pos = index.index(i)
+                        del index[pos]
+                        del rows[pos]
+
+            filters = App.right_panel.filters_vbox.get_filters()
+            cached = self.filter_cache.get(filters)
+            if cached is None:
+                cached = self.resolve(filters)
+            self.set_filtered(cached[1])
+            self.set_success(True)
+        if i is not None:
+            GLib.idle_add(self.model.discard, table, i)
         GLib.idle_add(App.treeview._filter_cleanup)
 
     def convert_model_to_list(self, model: Gtk.ListStore) -> list:
@@ -1783,14 +2284,18 @@ class ModelManagerSingleton:
     def get_filtered(self) -> list:
         return self.filtered
 
-    def set_store(self, model: Gtk.ListStore | None) -> None:
+    def set_store(self, model: ServerModel | None) -> None:
         self.store = model
 
-    def get_store(self) -> Gtk.ListStore | None:
+    def get_store(self) -> ServerModel | None:
         return self.store
 
     def set_control(self, rows: list) -> None:
+        self.stop_pinging()
+        # recent pings from earlier sessions show up before any re-ping
+        self.ping_cache.merge(rows)
         self.control_model = rows
+        self.table = Servers.ServerTable(rows)
 
     def set_success(self, result: bool) -> None:
         self.success = result
@@ -1801,10 +2306,14 @@ class ModelManagerSingleton:
     def wipe_cache(self, full=False) -> None:
         self.success = True
         self.filtered = None
-        self.filter_cache = {}
-        self.ping_cache = {}
+        if len(self.filter_cache) > 0:
+            logger.info(f"Dropping filter cache: {self.filter_cache.stats()}")
+        self.filter_cache.clear()
         if full:
+            self.stop_pinging()
             self.control_model = None
+            self.table = None
+            self.model.reset_sort()
 
 
 class TreeView(Gtk.TreeView):
@@ -1837,6 +2346,10 @@ class TreeView(Gtk.TreeView):
         self.page = WindowContext.MAIN_MENU
         self.subpage = None
         self.sel_blocked = False
+        self.wait_dialog = None
+        # a filter pass is in flight and the model is detached
+        self.filtering = False
+        self.filter_quiet = False
 
         self.set_fixed_height_mode(True)
         self.set_has_tooltip(True)
@@ -1894,9 +2407,18 @@ class TreeView(Gtk.TreeView):
         ip = model.get_value(tree_iter, 7)
         qport = model.get_value(tree_iter, 8)
         addr = ip + ":" + str(qport)
-        if addr not in notes_cache:
+        lines = []
+        if addr in notes_cache:
+            lines.append(notes_cache[addr])
+        # probe statistics behind the ping column, once measured
+        column = path[1]
+        if column is not None and column.get_title() == "Ping":
+            rtt = model.get_row(tree_iter).rtt
+            if rtt is not None:
+                lines.append(str(rtt))
+        if not lines:
             return False
-        tooltip.set_text(notes_cache[addr])
+        tooltip.set_text("\n".join(lines))
         self.set_tooltip_row(tooltip, path[0])
         return True
 
@@ -2409,6 +2931,16 @@ class TreeView(Gtk.TreeView):
         path = self.get_mpath()
         model[path][6] = players
 
+    def get_visible_positions(self) -> tuple[int, int]:
+        """First and last row positions on screen"""
+        visible = self.get_visible_range()
+        size = self.get_model().iter_n_children(None)
+        if not visible or visible[-2] is None:
+            return 0, min(size, PING_LOOKAHEAD) - 1
+        first = visible[-2].get_indices()[0]
+        last = visible[-1].get_indices()[0]
+        return first, min(last, size - 1)
+
     def enable_ping_column(self, state: bool) -> None:
         columns = self.get_columns()
         for column in columns:
@@ -2446,54 +2978,96 @@ class TreeView(Gtk.TreeView):
             return
         GLib.idle_add(_load)
 
-    def _dump_api(self):
+    def _dump_api(self, stream: bool = True) -> list | None:
+        """
+        Shards are parsed and streamed into a preview model as soon
+        as each one completes, so the first rows appear once the
+        fastest query returns rather than the slowest.
+        Background refreshes pass stream=False and leave the model
+        untouched on failure.
+        """
         key = query_config("steam_api")[0]
-        job = Servers.query_api
-        params = Servers.params
-        serv = []
-        with ThreadPoolExecutor() as executor:
-            futures = [
-                executor.submit(job, key, APPID_DAYZ, param)
-                for param in params
-            ]
-            wait(futures)
-            for future in futures:
-                res = future.result()
-                if res.status != 200 or not res.parsed:
-                    ModelManager.set_store(None)
-                    ModelManager.set_success(False)
-                    GLib.idle_add(self._filter_cleanup)
-                    return
-                j = res.json
-                serv += j["response"]["servers"]
-
-        res = Servers.query_api(key, APPID_DAYZ_EXP, "")
-        if res.status == 200 and res.parsed is True:
-            j = res.json
-            serv += j["response"]["servers"]
-
-        parsed = Servers.parse_json(serv)
-        return parsed
-
-    def _dump_lan(self, port: int) -> list | None:
-        with ThreadPoolExecutor() as executor:
-            futures = [
-                executor.submit(Servers.test_ip, i, port)
-                for i in range(1, 256)
-            ]
-            wait(futures)
-            servers = []
-            for future in futures:
-                res = future.result()
-                if res is None:
+        queries = [(APPID_DAYZ, param) for param in Servers.params]
+        queries.append((APPID_DAYZ_EXP, ""))
+        planner = Servers.ShardPlanner(shards_path)
+        parsed = []
+        shards = planner.run(key, queries)
+        for i, shard in enumerate(shards, start=1):
+            res = shard.res
+            if res.status != 200 or not res.parsed:
+                # the experimental branch is allowed to fail
+                if shard.appid == APPID_DAYZ_EXP:
                     continue
-                servers.append(res)
-            if len(servers) == 0:
+                shards.close()
+                if not stream:
+                    return None
                 ModelManager.set_store(None)
                 ModelManager.set_success(False)
                 GLib.idle_add(self._filter_cleanup)
                 return None
-            parsed = Servers.parse_json(servers)
+            if shard.size >= Servers.LIMIT:
+                logger.warning(f"Shard '{shard.param}' truncated at limit")
+            rows = res.rows
+            parsed += rows
+            if not stream:
+                continue
+            preview = ModelManager.preview(rows)
+            GLib.idle_add(
+                self._stream_rows, preview, len(parsed), i, planner.planned
+            )
+
+        planner.save()
+        return parsed
+
+    def _save_browser_cache(self, rows: list | None) -> None:
+        if not rows:
+            return
+        try:
+            Servers.save_rows(rows, servers_path)
+        except Servers.CacheError as e:
+            logger.warning(e)
+
+    def _revalidate_api(self, control: list) -> None:
+        """
+        Refreshes a cached server list in the background and merges
+        the differences into the model the user is looking at
+        """
+        fresh = self._dump_api(stream=False)
+        if fresh is None:
+            logger.warning("Background refresh of the server list failed")
+            return
+        logger.info(f"Background refresh returned {len(fresh)} servers")
+        self._save_browser_cache(fresh)
+        ModelManager.merge(control, fresh)
+
+    def _stream_rows(
+        self, rows: list, total: int, done: int, shards: int
+    ) -> None:
+        if self.wait_dialog:
+            self.wait_dialog.destroy()
+            self.wait_dialog = None
+
+        model = self.get_model()
+        if model is row_store:
+            model = ModelManager.new_model()
+            App.right_panel.reinit_maps([])
+            self.set_model(model)
+
+        for row in rows:
+            model.append(row)
+        App.right_panel.extend_maps(rows)
+        App.grid.statusbar.set_text(
+            f"Loaded {total:n} servers ({done}/{shards} queries)..."
+        )
+
+    def _dump_lan(self, port: int) -> list | None:
+        servers = Servers.scan_lan(port)
+        if len(servers) == 0:
+            ModelManager.set_store(None)
+            ModelManager.set_success(False)
+            GLib.idle_add(self._filter_cleanup)
+            return None
+        parsed = Servers.parse_json(servers)
         return parsed
 
     def _dump_servers(self, ips: list) -> list | None:
@@ -2501,32 +3075,19 @@ class TreeView(Gtk.TreeView):
             return []
         # NOTE: block malformed records
         ips = [ip for ip in ips if len(ip.split(":")) == 3 and ip.split(":")[2] != "" ]
-        with ThreadPoolExecutor() as executor:
-            futures = [
-                executor.submit(
-                    Servers.query_direct,
-                    ip.split(":")[0],
-                    int(ip.split(":")[2]),
-                )
-                for ip in ips
-            ]
-            wait(futures)
-            serv = []
-            for future in futures:
-                res = future.result()
-                if res is None:
-                    continue
-                serv.append(res)
-            if len(serv) == 0:
-                ModelManager.set_store(None)
-                ModelManager.set_success(False)
-                GLib.idle_add(self._filter_cleanup)
-                return None
-            parsed = Servers.parse_json(serv)
+        records = [(ip.split(":")[0], int(ip.split(":")[2])) for ip in ips]
+        serv = [res for res in Servers.query_many(records) if res]
+        if len(serv) == 0:
+            ModelManager.set_store(None)
+            ModelManager.set_success(False)
+            GLib.idle_add(self._filter_cleanup)
+            return None
+        parsed = Servers.parse_json(serv)
         return parsed
 
     def _query_servers(self, mode: RowType, port: int = 27016) -> None:
         block_signals()
+        revalidate = False
 
         match mode:
             case RowType.SCAN_LAN:
@@ -2534,7 +3095,15 @@ class TreeView(Gtk.TreeView):
             case RowType.SERVER_BROWSER:
                 App.treeview.enable_ping_column(False)
                 App.right_panel.enable_ping_button(True)
-                parsed = self._dump_api()
+                # stale-while-revalidate: show the cached snapshot at once
+                # and refresh it in the background unless on cooldown
+                parsed = Servers.load_rows(servers_path, BROWSER_CACHE_MAX_AGE)
+                if parsed is None:
+                    parsed = self._dump_api()
+                    self._save_browser_cache(parsed)
+                else:
+                    cooldown = call_out("test_cooldown", "", "")
+                    revalidate = cooldown.returncode == 0
             case RowType.SAVED_SERVERS:
                 App.treeview.enable_ping_column(True)
                 favs = query_favorites()
@@ -2563,7 +3132,11 @@ class TreeView(Gtk.TreeView):
         ModelManager.set_control(parsed)
         ModelManager.filter(FilterMode.INITIAL)
 
+        if revalidate:
+            self._revalidate_api(parsed)
+
     def _filter_cleanup(self, empty: bool = False) -> None:
+        self.filtering = False
         model = ModelManager.get_store()
         self.set_model(model)
 
@@ -2579,6 +3152,7 @@ class TreeView(Gtk.TreeView):
         if not ModelManager.get_success():
             if self.wait_dialog:
                 self.wait_dialog.destroy()
+                self.wait_dialog = None
             spawn_dialog(api_warn_msg, Popup.RETURN)
             unblock_signals()
             return
@@ -2593,22 +3167,34 @@ class TreeView(Gtk.TreeView):
 
         if self.wait_dialog:
             self.wait_dialog.destroy()
+            self.wait_dialog = None
         unblock_signals()
+        ModelManager.ping_viewport()
+        # keep focus in the keyword entry while searching as you type
+        if self.filter_quiet:
+            self.filter_quiet = False
+            return
         self.grab_focus()
         App.treeview.select_first_row()
 
-    def filter(self, mode: FilterMode, *args) -> None:
-        block_signals()
-        self.wait_dialog = GenericDialog("Filtering servers", Popup.WAIT)
-        self.wait_dialog.show_all()
-
-        ModelManager.set_store(App.treeview.get_model())
-        App.treeview.set_model(None)
-
-        thread = threading.Thread(
-            target=ModelManager.filter, args=(mode, *args)
-        )
-        thread.start()
+    def filter(self, mode: FilterMode, *args, quiet: bool = False) -> None:
+        """
+        Quiet passes (search-as-you-type) skip the modal wait dialog
+        so the keyword entry keeps focus. Requests made while a pass
+        is in flight supersede it rather than queueing behind it.
+        """
+        if not self.filtering:
+            self.filtering = True
+            self.wait_dialog = None
+            block_signals()
+            ModelManager.set_store(App.treeview.get_model())
+            App.treeview.set_model(None)
+        if not quiet and self.wait_dialog is None:
+            self.wait_dialog = GenericDialog("Filtering servers", Popup.WAIT)
+            self.wait_dialog.show_all()
+        self.filter_quiet = quiet
+
+        ModelManager.submit(mode, *args)
 
     def _background_quad(self, dialog: "GenericDialog", mode: RowType) -> None:
         # currently only used by list mods method
@@ -3085,7 +3671,9 @@ class TreeView(Gtk.TreeView):
         if self.is_row_to_server_context(cr):
             if cr == RowType.SERVER_BROWSER:
                 cooldown = call_out("test_cooldown", "", "")
-                if cooldown.returncode == 1:
+                age = Servers.cache_age(servers_path)
+                cached = age is not None and age < BROWSER_CACHE_MAX_AGE
+                if cooldown.returncode == 1 and not cached:
                     spawn_dialog(cooldown.stdout, Popup.NOTIFY)
                     self.set_view(WindowContext.MAIN_MENU)
                     return
@@ -4521,15 +5109,11 @@ class Statusbar(Gtk.Statusbar):
         self.set_text(self.players + dist)
 
     def update_server_meta(self) -> None:
+        # read the rows directly rather than through the TreeModel
         model = App.treeview.get_model()
-        if model is None:
-            players = 0
-            hits = 0
-        else:
-            hits = len(model)
-            players = 0
-            for row in model:
-                players += row[4]
+        rows = model.get_rows() if isinstance(model, ServerModel) else []
+        hits = len(rows)
+        players = sum(row.players for row in rows)
 
         players_pretty = pluralize("players", players)
         hits_pretty = pluralize("matches", hits)
@@ -4805,6 +5389,18 @@ class ModSelectionPanel(Gtk.Box):
 
 
 class FilterPanel(Gtk.Box):
+    dedup_identities = {
+        "name": "Name",
+        "normalized": "Similar name",
+        "ip": "IP",
+        "addr": "IP and port",
+    }
+    dedup_survivors = {
+        "first": "First listed",
+        "ping": "Lowest ping",
+        "population": "Most players",
+    }
+
     def __init__(self):
         super().__init__(spacing=6)
 
@@ -4827,6 +5423,7 @@ class FilterPanel(Gtk.Box):
         self.maps_hr = []
         self.enabled_filters = dict(self.default_filters)
         self.keyword_filter = ""
+        self.keyword_timer = None
         self.selected_map = "All maps"
         self.prior_map = "All maps"
 
@@ -4862,6 +5459,7 @@ class FilterPanel(Gtk.Box):
         self.keyword_entry = Gtk.Entry()
         self.keyword_entry.set_placeholder_text("Filter by keyword")
         self.keyword_entry.connect("activate", self._on_keyword_enter)
+        self.keyword_entry.connect("changed", self._on_keyword_changed)
         self.keyword_entry.connect(
             "key-press-event", self._on_keyword_keypress
         )
@@ -4891,15 +5489,70 @@ class FilterPanel(Gtk.Box):
 
         self.pack_start(button_grid, False, False, 0)
 
+        # 0 leaves a range open
+        self.range_timer = None
+        self.range_spins = {}
+        range_grid = Gtk.Grid(column_spacing=5, row_spacing=2)
+        specs = [
+            ("Max ping (ms)", ["ping"], 999, 10),
+            ("Players", ["players_min", "players_max"], 255, 1),
+            ("Max queue", ["queue"], 255, 1),
+            ("Max distance (km)", ["distance"], 20000, 100),
+        ]
+        for row, (title, keys, upper, step) in enumerate(specs):
+            label = Gtk.Label(label=title, xalign=0)
+            range_grid.attach(label, 0, row, 1, 1)
+            for col, key in enumerate(keys, start=1):
+                spin = Gtk.SpinButton.new_with_range(0, upper, step)
+                spin.set_numeric(True)
+                spin.connect("value-changed", self._on_range_changed)
+                width = 2 if len(keys) == 1 else 1
+                range_grid.attach(spin, col, row, width, 1)
+                self.range_spins[key] = spin
+        self.range_spins["distance"].set_tooltip_text(
+            "Distances are known once a server has been selected. "
+            "Servers with an unknown distance are hidden while set."
+        )
+        self.pack_start(range_grid, False, False, 0)
+
+        dedup_grid = Gtk.Grid(column_spacing=5, row_spacing=2)
+        self.dedup_combos = {}
+        specs = [
+            ("Duplicates by", "identity", self.dedup_identities),
+            ("Keep", "survivor", self.dedup_survivors),
+        ]
+        for row, (title, key, choices) in enumerate(specs):
+            label = Gtk.Label(label=title, xalign=0)
+            dedup_grid.attach(label, 0, row, 1, 1)
+            combo = Gtk.ComboBoxText()
+            for value, text in choices.items():
+                combo.append(value, text)
+            combo.set_active(0)
+            combo.connect("changed", self._on_dedup_changed)
+            dedup_grid.attach(combo, 1, row, 1, 1)
+            self.dedup_combos[key] = combo
+        self.pack_start(dedup_grid, False, False, 0)
+
     def set_unique_maps(self, maps: list) -> None:
         if len(maps) < 1:
             return
-        u_maps = set([row[1] for row in maps])  # type: ignore
+        u_maps = set([row.map for row in maps])  # type: ignore
         u_maps = sorted(u_maps)  # type: ignore
         for m in u_maps:
             map_store.append([m])
             self.maps_hr.append(m)
 
+    def add_unique_maps(self, rows: list) -> None:
+        """Inserts unseen maps in sorted order after 'All maps'"""
+        known = [row[0] for row in map_store][1:]
+        for m in sorted(set([row.map for row in rows])):
+            if m in known:
+                continue
+            pos = bisect.bisect(known, m)
+            known.insert(pos, m)
+            map_store.insert(pos + 1, [m])
+            self.maps_hr.append(m)
+
     def get_filters(self) -> tuple:
         filters = []
         filters.append(self.selected_map)
@@ -4907,8 +5560,61 @@ class FilterPanel(Gtk.Box):
         for k in self.enabled_filters:
             if not self.enabled_filters[k]:
                 filters.append(k)
+        filters += self.get_ranges()
+        if not self.enabled_filters["Duplicate"]:
+            filters.append(self.get_dedup_spec())
         return tuple(filters)
 
+    def get_dedup_spec(self) -> "Servers.DedupSpec":
+        identity = self.dedup_combos["identity"].get_active_id()
+        survivor = self.dedup_combos["survivor"].get_active_id()
+        return Servers.DedupSpec(identity, survivor)
+
+    def _on_dedup_changed(self, combo: Gtk.ComboBoxText) -> None:
+        if not App.treeview.is_server_context(App.treeview.view):
+            return
+        if self.enabled_filters["Duplicate"]:
+            return
+        spec = self.get_dedup_spec()
+        logger.info(f"User changed duplicate culling to {spec}")
+        App.treeview.filter(FilterMode.TOGGLE_OFF, "Duplicate")
+
+    def get_ranges(self) -> list[tuple[str, int, int]]:
+        """Active range filters as (field, low, high), inclusive"""
+        values = {
+            k: spin.get_value_as_int() for k, spin in self.range_spins.items()
+        }
+        ranges = []
+        for field in ("ping", "queue", "distance"):
+            if values[field] > 0:
+                ranges.append((field, 0, values[field]))
+        low = values["players_min"]
+        high = values["players_max"] or RANGE_MAX
+        if low > 0 or high < RANGE_MAX:
+            ranges.append(("players", low, high))
+        return ranges
+
+    def reinit_ranges(self) -> None:
+        for spin in self.range_spins.values():
+            spin.set_value(0)
+        if self.range_timer is not None:
+            GLib.source_remove(self.range_timer)
+            self.range_timer = None
+
+    def _on_range_changed(self, spin: Gtk.SpinButton) -> None:
+        if self.range_timer is not None:
+            GLib.source_remove(self.range_timer)
+        self.range_timer = GLib.timeout_add(
+            KEYWORD_DEBOUNCE_MS, self._on_range_timeout
+        )
+
+    def _on_range_timeout(self) -> Literal[False]:
+        self.range_timer = None
+        if App.treeview.is_server_context(App.treeview.view):
+            logger.info(f"User set range filters {self.get_ranges()}")
+            App.treeview.filter(FilterMode.RANGE, quiet=True)
+        return False
+
     # used on personal/local server lists
     def enable_all_filters(self) -> None:
         for check in self.checks:
@@ -4918,8 +5624,10 @@ class FilterPanel(Gtk.Box):
 
     def reinit_panel(self) -> None:
         self.keyword_entry.set_text("")
+        self.cancel_keyword_timer()
         self.keyword_filter = ""
         self.reinit_filters()
+        self.reinit_ranges()
         self.set_visible(False)
         sel_panel = App.grid.sel_panel
         if sel_panel.is_visible():
@@ -5014,6 +5722,29 @@ class FilterPanel(Gtk.Box):
 
     def _on_keyword_enter(self, entry: Gtk.Entry) -> None:
         App.window.set_keep_below(False)
+        self.cancel_keyword_timer()
+        self.apply_keyword(entry)
+
+    def _on_keyword_changed(self, entry: Gtk.Entry) -> None:
+        """Debounces search-as-you-type while the user is still typing"""
+        self.cancel_keyword_timer()
+        if not App.treeview.is_server_context(App.treeview.view):
+            return
+        self.keyword_timer = GLib.timeout_add(
+            KEYWORD_DEBOUNCE_MS, self._on_keyword_timeout, entry
+        )
+
+    def _on_keyword_timeout(self, entry: Gtk.Entry) -> Literal[False]:
+        self.keyword_timer = None
+        self.apply_keyword(entry, quiet=True)
+        return False
+
+    def cancel_keyword_timer(self) -> None:
+        if self.keyword_timer is not None:
+            GLib.source_remove(self.keyword_timer)
+            self.keyword_timer = None
+
+    def apply_keyword(self, entry: Gtk.Entry, quiet: bool = False) -> None:
         keyword = entry.get_text().lower()
         if keyword == self.keyword_filter:
             return
@@ -5021,7 +5752,7 @@ class FilterPanel(Gtk.Box):
             return
         logger.info(f"User filtered by keyword '{keyword}'")
         self.keyword_filter = keyword
-        App.treeview.filter(FilterMode.KEYWORD, keyword)
+        App.treeview.filter(FilterMode.KEYWORD, keyword, quiet=quiet)
 
     def _on_button_release(self, window, button) -> Literal[True]:
         return True
@@ -5085,7 +5816,16 @@ def main():
     logger.info("Spawned UI from DZGUI setup process")
     global _VERSION
     _VERSION = sys.argv[2]
+    # query timeouts adapt to each server's history across sessions
+    Servers.engine.rtt = Servers.RttEstimator(rtt_path)
+    # shell helpers query through this process instead of spawning one
+    query_service = Servers.QueryService(query_socket)
+    try:
+        query_service.start()
+    except OSError as e:
+        logger.warning(f"Query service unavailable: {e}")
     App()
+    query_service.stop()
 
 
 ModelManager = ModelManagerSingleton()